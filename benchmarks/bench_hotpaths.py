@@ -0,0 +1,213 @@
+"""
+本地CPU热点路径的微基准: 格式检查、<result>抽取、逻辑分数解析、反思打分、Filter过滤与样本去重。
+使用合成的中文COT语料(1KB-50KB)、最多100万行的评分表与同一模板生成的问题, 输出随规模变化的耗时曲线
+(答案格式检查与流水线中一样只以抽取出的<result>内容为输入, 吞吐按实际输入字节数计算),
+(去重同时输出平均每个样本比较的候选代表数, 应随样本数近似不变), 并支持保存基线、与基线对比。
+
+python benchmarks/bench_hotpaths.py --save baseline.json
+python benchmarks/bench_hotpaths.py --compare baseline.json --threshold 0.1
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkers.formatchecker import FormatChecker
+from checkers.labelgenerator import LabelGenerator
+from checkers.correctnesschecker import CorrectnessChecker
+from checkers.logicchecker import LogicChecker
+from checkers.reflectionchecker import ReflectionChecker
+from checkers.filter import Filter
+from dedup import cluster_examples
+
+COT_SIZES = [1024, 5 * 1024, 20 * 1024, 50 * 1024]
+ROW_COUNTS = [1000, 10000, 100000, 1000000]
+DEDUP_SIZES = [1000, 2000, 4000, 8000]
+
+_PHRASES = ['首先，根据年报披露的数据', '公司营业收入同比增长', '重新审视上一步的计算', '或许需要考虑非经常性损益',
+            '等等，这里的口径可能不同', '因此可以得出结论', '净利润率为', '行业地位方面', '研发投入占比', '综上所述']
+
+
+def make_cot(size_bytes, rng):
+    """生成UTF-8编码约 size_bytes 字节的中文COT, 包含<think>、<steps>与<result>标签"""
+    parts = []
+    length = 0
+    step = 1
+    while length < size_bytes:
+        sentence = f"{step}. {rng.choice(_PHRASES)}{rng.randint(1, 9999)}.{rng.randint(0, 99)}%，{rng.choice(_PHRASES)}。\n"
+        parts.append(sentence)
+        length += len(sentence.encode('utf-8'))
+        step += 1
+    body = ''.join(parts)
+    half = len(body) // 2
+    return f"<think>{body[:half]}</think>\n<steps>{body[half:]}</steps>\n<result>{rng.randint(1, 999)}.{rng.randint(0, 99)}</result>"
+
+
+def make_logic_output(rng):
+    return f"Ent Calculation: ...\n<answer>\n[Ent,Fav]=[{rng.random():.2f}, {rng.random():.2f}]\n</answer>"
+
+
+def make_scores(rows, rng):
+    """生成Filter所需的评分表, 每个问题约5条COT"""
+    np_rng = np.random.default_rng(rng.randint(0, 2 ** 31))
+    df = pd.DataFrame({col: np_rng.integers(0, max_val + 1, rows) for col, max_val in Filter.max_scores.items()})
+    df['question'] = 'q' + pd.Series(np_rng.integers(0, max(rows // 5, 1), rows)).astype(str)
+    df['困难等级'] = np_rng.choice([0.0, 0.2, 0.4, 0.6, 0.8, 1.0], rows)
+    df['RAG'] = np_rng.choice(['[]', "[{'id': 1, 'text': '...'}]"], rows, p=[0.05, 0.95])
+    return df
+
+
+def make_templated_examples(n, rng, duplicate_rate=0.1):
+    """同一模板的问题(年份、公司、答案不同), 其中 duplicate_rate 比例为前面样本的改写"""
+    examples = []
+    for _ in range(n):
+        if examples and rng.random() < duplicate_rate:
+            example = dict(rng.choice(examples))
+            example['question'] = example['question'].replace('是多少？', '为多少？')
+        else:
+            year, company = rng.randint(2010, 2024), f"{rng.choice(_PHRASES)[:2]}{rng.randint(1, 500)}号公司"
+            example = {'question': f"{year}年，{company}的营业收入是多少？",
+                       'RAG': f"[{{'id': 1, 'text': '{company}{year}年年报显示，{rng.choice(_PHRASES)}，营业收入{rng.randint(1, 999)}亿元。'}}]",
+                       'answer': f"{rng.randint(1, 999)}亿元"}
+        examples.append(example)
+    return examples
+
+
+def measure(fn, min_time=0.2, repeat=3):
+    """返回单次调用的最短平均耗时(秒)"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def text_benchmarks():
+    """名称 -> 以COT文本为输入的函数"""
+    # 跳过 Evaluator.__init__, 不创建LLM客户端与tokenizer
+    logic = object.__new__(LogicChecker)
+    reflection = object.__new__(ReflectionChecker)
+    return {
+        'FormatChecker.is_mostly_chinese': lambda text: FormatChecker.is_mostly_chinese(text, 0.6),
+        'FormatChecker.check_answer_format': FormatChecker.check_answer_format,
+        'LabelGenerator.extract_result_content': lambda text: LabelGenerator.extract_result_content(None, text),
+        'CorrectnessChecker.extract_result_content': lambda text: CorrectnessChecker.extract_result_content(None, text),
+        'LogicChecker.parse_result': lambda text: logic.parse_result(text),
+        'ReflectionChecker.check': lambda text: reflection.check(text),
+    }
+
+
+# 流水线中只接收<result>标签内答案的函数, 以从合成COT中抽取的答案为输入
+RESULT_ONLY = {'FormatChecker.check_answer_format'}
+
+
+def run(sizes, row_counts, dedup_sizes=DEDUP_SIZES, only=None, seed=0):
+    rng = random.Random(seed)
+    results = []
+
+    for name, fn in text_benchmarks().items():
+        if only and only not in name:
+            continue
+        for size in sizes:
+            text = make_cot(size, rng)
+            if name == 'LogicChecker.parse_result':
+                # 逻辑评分输出附在长文本之后, 覆盖正则扫描整段文本的情况
+                text = text + make_logic_output(rng)
+            if name in RESULT_ONLY:
+                text = LabelGenerator.extract_result_content(None, text)
+            input_bytes = len(text.encode('utf-8'))
+            seconds = measure(lambda: fn(text))
+            results.append({'benchmark': name, 'size': size, 'seconds': seconds,
+                            'throughput': input_bytes / seconds / 1e6, 'unit': 'MB/s'})
+            print(f"{name:45s} {size // 1024:>6d}KB {seconds * 1e6:12.1f}us {input_bytes / seconds / 1e6:10.1f} MB/s")
+
+    if not only or only in 'Filter.filter':
+        filter_instance = Filter()
+        for rows in row_counts:
+            df = make_scores(rows, rng)
+            seconds = measure(lambda: filter_instance.filter(df), min_time=0.5, repeat=2)
+            results.append({'benchmark': 'Filter.filter', 'size': rows, 'seconds': seconds,
+                            'throughput': rows / seconds, 'unit': 'rows/s'})
+            print(f"{'Filter.filter':45s} {rows:>8d} {seconds * 1e3:10.1f}ms {rows / seconds:12.0f} rows/s")
+
+    if not only or only in 'dedup.cluster_examples':
+        for n in dedup_sizes:
+            examples = make_templated_examples(n, rng)
+            start = time.perf_counter()
+            _, audit = cluster_examples(examples)
+            seconds = time.perf_counter() - start
+            candidates = sum(record['candidates'] for record in audit) / n
+            results.append({'benchmark': 'dedup.cluster_examples', 'size': n, 'seconds': seconds,
+                            'throughput': n / seconds, 'unit': 'examples/s', 'candidates_per_example': candidates})
+            print(f"{'dedup.cluster_examples':45s} {n:>8d} {seconds * 1e3:10.1f}ms {n / seconds:12.0f} examples/s"
+                  f" {candidates:8.2f} candidates/example")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线对比, 返回耗时增加超过 threshold 的条目数"""
+    base = {(r['benchmark'], r['size']): r['seconds'] for r in baseline}
+    regressions = 0
+    print(f"\n{'benchmark':45s} {'size':>8s} {'baseline':>12s} {'current':>12s} {'ratio':>7s}")
+    for r in results:
+        key = (r['benchmark'], r['size'])
+        if key not in base:
+            continue
+        ratio = r['seconds'] / base[key]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{r['benchmark']:45s} {r['size']:>8d} {base[key] * 1e3:10.3f}ms {r['seconds'] * 1e3:10.3f}ms {ratio:7.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest sizes")
+    parser.add_argument("--max-rows", type=int, default=ROW_COUNTS[-1], help="Largest row count for Filter.filter")
+    parser.add_argument("--only", type=str, default=None, help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--save", type=str, default=None, help="Save results as a baseline JSON")
+    parser.add_argument("--compare", type=str, default=None, help="Compare against a saved baseline JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = COT_SIZES[:2] if args.quick else COT_SIZES
+    row_counts = [n for n in ROW_COUNTS if n <= args.max_rows]
+    dedup_sizes = DEDUP_SIZES
+    if args.quick:
+        row_counts = row_counts[:2]
+        dedup_sizes = dedup_sizes[:2]
+
+    results = run(sizes, row_counts, dedup_sizes, only=args.only, seed=args.seed)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,113 @@
+"""
+在留出集上拟合 LT_difficulty_logprob 的困难等级校准:
+对每条样本分别运行多次采样的 LT_difficulty(得到通过率)与 LT_difficulty_logprob 的少量采样(得到每次采样是否答对及置信度),
+按答对/答错两个分支分别用保序回归拟合 置信度 -> 通过率 的映射并保存, 保存路径填入 LT_difficulty_logprob 的 calibration 参数。
+
+python calibrate_difficulty.py --config config.json --data heldout.xlsx --output difficulty_calibration.json
+"""
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+from inference import load_config, load_data, initialize_checker, run_label_generator, map_rows
+from checkers.calibration import DifficultyCalibrator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def label_methods(config):
+    """取出 LabelGenerator 配置及其中 LT_difficulty 与 LT_difficulty_logprob 的方法配置(不论是否启用)"""
+    for checker_cfg in config["checkers"]:
+        if checker_cfg["class_name"] == "LabelGenerator":
+            methods = {m["method_name"]: m for m in checker_cfg["methods"]}
+            reference = methods.get("LT_difficulty", {"method_name": "LT_difficulty", "params": {"attempts": 5}})
+            estimator = methods.get("LT_difficulty_logprob", {"method_name": "LT_difficulty_logprob", "params": {}})
+            # 拟合时只需要每次采样的结果, 不使用已有的校准
+            params = {k: v for k, v in estimator.get("params", {}).items() if k != "calibration"}
+            return checker_cfg, reference, params
+    raise ValueError("Config has no LabelGenerator")
+
+
+def predict_pass_rates(calibrator, samples):
+    """每个问题的通过率估计: 该问题各次采样估计的平均"""
+    samples = samples.assign(estimate=[calibrator.predict(None if np.isnan(c) else c, bool(k))
+                                       for c, k in zip(samples["confidence"], samples["correct"])])
+    return samples.groupby("example")["estimate"].mean()
+
+
+def evaluate(calibrator, samples, targets, difficulty_cut):
+    """校准前后通过率的平均绝对误差, 以及按 difficulty_cut 判断是否保留时与多次采样结论的一致率"""
+    target = targets.to_numpy()
+    hard = 1 - target >= difficulty_cut
+    report = {}
+    for name, model in (("raw", DifficultyCalibrator()), ("calibrated", calibrator)):
+        predicted = predict_pass_rates(model, samples).reindex(targets.index).to_numpy()
+        report[f"mae_{name}"] = float(np.mean(np.abs(predicted - target)))
+        report[f"agreement_{name}"] = float(np.mean((1 - predicted >= difficulty_cut) == hard))
+    return report
+
+
+def main(args):
+    config = load_config(args.config)
+    examples = load_data(args.data or config["data_path"])
+    if args.limit and len(examples) > args.limit:
+        rng = np.random.default_rng(args.seed)
+        examples = [examples[i] for i in sorted(rng.choice(len(examples), args.limit, replace=False))]
+    logger.info(f"Calibrating on {len(examples)} held-out examples")
+
+    checker_cfg, reference, params = label_methods(config)
+    label_generator = initialize_checker(checker_cfg)
+
+    def run(example):
+        _, _, _, pass_rate = run_label_generator(label_generator, reference, example)
+        _, scores, _, confidences = label_generator.logprob_samples(
+            example["question"], example["RAG"], example["answer"], **params)
+        return pass_rate, scores, confidences
+
+    rows = []
+    targets = {}
+    for index, (example, (pass_rate, scores, confidences)) in enumerate(zip(examples, map_rows(run, examples, args.workers))):
+        targets[index] = pass_rate
+        for score, confidence in zip(scores, confidences):
+            rows.append({"example": index, "question": example["question"], "pass_rate": pass_rate, "score": score,
+                         "correct": label_generator.is_correct(score),
+                         "confidence": np.nan if confidence is None else confidence})
+    samples = pd.DataFrame(rows)
+    targets = pd.Series(targets, dtype=np.float64)
+    if args.report:
+        samples.to_csv(args.report, index=False, encoding="utf-8-sig")
+    if samples.empty:
+        raise ValueError("No samples generated for calibration")
+
+    difficulty_cut = reference.get("params", {}).get("difficulty_cut", 0.2)
+
+    def fit(subset):
+        return DifficultyCalibrator().fit(subset["confidence"], subset["correct"], subset["pass_rate"])
+
+    # 按问题留出一部分样本评估校准效果, 最终校准在全部样本上拟合
+    n_eval = int(len(targets) * args.eval_fraction)
+    if n_eval > 0 and len(targets) - n_eval > 1:
+        order = np.random.default_rng(args.seed).permutation(targets.index.to_numpy())
+        eval_ids = set(order[:n_eval])
+        held_out = samples["example"].isin(eval_ids)
+        report = evaluate(fit(samples[~held_out]), samples[held_out], targets.loc[sorted(eval_ids)], difficulty_cut)
+        logger.info(f"Held-out evaluation on {n_eval} examples: {report}")
+
+    calibrator = fit(samples)
+    calibrator.save(args.output)
+    logger.info(f"Saved calibration to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="config.json", help="Path to configuration JSON")
+    parser.add_argument("--data", type=str, default=None, help="Held-out data path, defaults to data_path in config")
+    parser.add_argument("--output", type=str, default="difficulty_calibration.json", help="Calibration JSON to write")
+    parser.add_argument("--report", type=str, default=None, help="Optional CSV with per-sample correctness, confidence and pass rate")
+    parser.add_argument("--limit", type=int, default=None, help="Randomly sample at most this many examples")
+    parser.add_argument("--eval_fraction", type=float, default=0.2, help="Fraction of examples kept out to evaluate the fit")
+    parser.add_argument("--workers", type=int, default=1, help="Examples processed concurrently")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -2,16 +2,22 @@
 from openai import OpenAI
 from transformers import AutoTokenizer
 from traceback import format_exc
+from .diagnostics import DIAGNOSTICS
 
 class Evaluator:
     """
     作为所有 Checker 的基类, 提供与 LLM 交互或其他公共功能
     """
+    diagnostics = DIAGNOSTICS
+    # 可选的 RequestScheduler, 设置后所有请求经其排队调度
+    scheduler = None
+
     def __init__(self, **kwargs):
         # 初始化 LLM 客户端
         self.api_key = kwargs.pop("api_key", "EMPTY")
         self.base_url = kwargs.pop("base_url", "http://172.18.1.3:12345/v1")
         self.model = kwargs.pop("model", "deepseek-reasoner")
+        self.diagnostics = kwargs.pop("diagnostics", self.diagnostics)
         
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
         self.tokenizer = AutoTokenizer.from_pretrained('/data1/models/DeepSeek-R1')
@@ -64,17 +70,70 @@ class Evaluator:
             yield f"Error: {e}" # 流式返回错误信息
 
 
-    def request_llm(self, text_data, max_tokens=1024, temperature=0.6,system=None):
+    def request_llm(self, text_data, max_tokens=1024, temperature=0.6,system=None,kind=None,prompt_tokens=None):
+        """
+        通用文本分析，配置了调度器时按预计长度排队后发送。
+        kind 为请求类别(如 "LogicChecker.check")，prompt_tokens 为调用方已计算的输入token数，未给出时按字符数估计
+        """
+        if self.scheduler is None:
+            return self._request_llm(text_data, max_tokens, temperature, system)
+        
+        kind = kind or self.__class__.__name__
+        prompt_tokens = len(text_data) if prompt_tokens is None else prompt_tokens
+        result, output_tokens = self.scheduler.run(
+            lambda: self._collect_stream(text_data, max_tokens, system),
+            prompt_tokens, max_tokens, kind)
+        self.scheduler.observe(kind, output_tokens)
+        return result
+
+    def request_llm_logprobs(self, text_data, max_tokens=1024, temperature=0.6, system=None, kind=None, prompt_tokens=None):
+        """非流式请求并返回每个输出token的logprob，返回(生成文本, [(token, logprob), ...])，kind 与 prompt_tokens 同 request_llm"""
+        if self.scheduler is None:
+            return self._request_llm_logprobs(text_data, max_tokens, temperature, system)
+
+        kind = kind or self.__class__.__name__
+        prompt_tokens = len(text_data) if prompt_tokens is None else prompt_tokens
+        result, token_logprobs = self.scheduler.run(
+            lambda: self._request_llm_logprobs(text_data, max_tokens, temperature, system),
+            prompt_tokens, max_tokens, kind)
+        self.scheduler.observe(kind, len(token_logprobs))
+        return result, token_logprobs
+
+    def _request_llm_logprobs(self, text_data, max_tokens=1024, temperature=0.6, system=None):
+        try:
+            messages = self._create_request(f"{text_data}", system)
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                logprobs=True
+            )
+            choice = response.choices[0]
+            content = getattr(choice.logprobs, "content", None) or []
+            return choice.message.content or "", [(item.token, item.logprob) for item in content]
+
+        except Exception as e:
+            print("error!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!", format_exc())
+            return "", []
+
+    def _request_llm(self, text_data, max_tokens=1024, temperature=0.6,system=None):
         """通用文本分析，支持流式和非流式返回"""
+        return self._collect_stream(text_data, max_tokens, system)[0]
+
+    def _collect_stream(self, text_data, max_tokens=1024, system=None):
+        """拼接流式返回的结果，同时返回分片数：流式返回的每个分片通常对应一个token，用作输出token数的近似值"""
         try:
             # 调用流式接口，不论stream值是否为True
             result = ""
+            chunks = 0
             for chunk in self.request_llm_stream(text_data, max_tokens, system):
                 result += chunk
+                chunks += 1
                 #print ('result===============', chunk)
-            return result
+            return result, chunks
 
         except Exception as e:
            
             print("error!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!", format_exc())
-            return ""
+            return "", 0
@@ -0,0 +1,114 @@
+# checkers/calibration.py
+import os
+import json
+import threading
+import numpy as np
+
+
+class IsotonicCalibrator:
+    """
+    单调(保序)校准: 用PAV算法拟合分段常数的单调函数, 预测时在各段中点之间线性插值。
+    increasing 为False时拟合单调非增函数。
+    """
+    def __init__(self, x=None, y=None, increasing=True):
+        self.x = np.asarray(x if x is not None else [], dtype=np.float64)
+        self.y = np.asarray(y if y is not None else [], dtype=np.float64)
+        self.increasing = increasing
+
+    def fit(self, raw, target, weight=None):
+        raw = np.asarray(raw, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        weight = np.ones_like(raw) if weight is None else np.asarray(weight, dtype=np.float64)
+        keep = ~(np.isnan(raw) | np.isnan(target))
+        if not keep.any():
+            raise ValueError("No valid samples to fit calibration")
+        order = np.argsort(raw[keep], kind="mergesort")
+        raw, target, weight = raw[keep][order], target[keep][order], weight[keep][order]
+        # 非增拟合等价于对 -target 做非降拟合
+        sign = 1.0 if self.increasing else -1.0
+
+        # PAV: 相邻块均值逆序时合并, 每块记录 (加权均值, 权重, raw加权和)
+        means, weights, sums = [], [], []
+        for r, t, w in zip(raw, sign * target, weight):
+            means.append(t)
+            weights.append(w)
+            sums.append(r * w)
+            while len(means) > 1 and means[-2] > means[-1]:
+                w = weights[-2] + weights[-1]
+                means[-2] = (means[-2] * weights[-2] + means[-1] * weights[-1]) / w
+                weights[-2] = w
+                sums[-2] += sums[-1]
+                del means[-1], weights[-1], sums[-1]
+
+        self.x = np.array(sums) / np.array(weights)
+        self.y = np.clip(sign * np.array(means), 0.0, 1.0)
+        return self
+
+    def predict(self, raw):
+        if len(self.x) == 0:
+            return np.asarray(raw, dtype=np.float64)
+        return np.interp(raw, self.x, self.y)
+
+    def to_dict(self):
+        return {"x": self.x.tolist(), "y": self.y.tolist(), "increasing": self.increasing}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["x"], data["y"], data.get("increasing", True))
+
+
+class DifficultyCalibrator:
+    """
+    单次采样的通过率校准, 答对与答错的采样分别按置信度拟合:
+    答对时置信度越高通过率越高; 答错时置信度越高说明模型稳定地答错, 通过率越低。
+    未拟合的分支按未校准的估计处理: 答对为置信度, 答错为0。
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, correct=None, wrong=None):
+        self.correct = correct
+        self.wrong = wrong
+
+    def fit(self, confidences, correct, target):
+        confidences = np.asarray(confidences, dtype=np.float64)
+        correct = np.asarray(correct, dtype=bool)
+        target = np.asarray(target, dtype=np.float64)
+        if (correct & ~np.isnan(confidences)).any():
+            self.correct = IsotonicCalibrator(increasing=True).fit(confidences[correct], target[correct])
+        if (~correct & ~np.isnan(confidences)).any():
+            self.wrong = IsotonicCalibrator(increasing=False).fit(confidences[~correct], target[~correct])
+        return self
+
+    def predict(self, confidence, correct):
+        """单次采样的通过率估计, 没有置信度时只按是否答对给出0或1"""
+        if confidence is None:
+            return 1.0 if correct else 0.0
+        branch = self.correct if correct else self.wrong
+        if branch is None:
+            return confidence if correct else 0.0
+        return float(branch.predict(confidence))
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({name: branch.to_dict() for name, branch in (("correct", self.correct), ("wrong", self.wrong))
+                       if branch is not None}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(*(IsotonicCalibrator.from_dict(data[name]) if name in data else None for name in ("correct", "wrong")))
+
+    @classmethod
+    def cached(cls, path):
+        """按路径缓存已加载的校准, 各行共用; 未给出或文件不存在时使用未校准的估计"""
+        with cls._lock:
+            if path not in cls._cache:
+                if path and os.path.exists(path):
+                    cls._cache[path] = cls.load(path)
+                else:
+                    if path:
+                        print(f"Warning: calibration file {path} not found, using uncalibrated difficulty estimates.")
+                    cls._cache[path] = cls()
+            return cls._cache[path]
@@ -44,10 +44,10 @@ class CorrectnessChecker(Evaluator):
 -<result></result>之间的内容只应该是得分，即数值
 """
         inputokens=self.calc_text_token(question)    
-        model_answer = self.request_llm(question,16348-inputokens)
+        model_answer = self.request_llm(question,16348-inputokens,kind="CorrectnessChecker.compare_answers",prompt_tokens=inputokens)
         stripped_answer = self.extract_result_content(model_answer)
         #print("得分:",stripped_answer)
-        if re.fullmatch(r"[0-9]+(\.[0-9]+)?", stripped_answer):
+        if stripped_answer and re.fullmatch(r"[0-9]+(\.[0-9]+)?", stripped_answer):
             return int(float(stripped_answer))
         return 0
     
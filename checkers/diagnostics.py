@@ -0,0 +1,94 @@
+# checkers/diagnostics.py
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import Counter, deque
+
+# 问题代码 -> (检查器, 方法, 说明)
+ISSUE_CODES = {
+    "THINK_MISSING": ("FormatChecker", "check_think", "Error: 文本中没有找到<think>标签。"),
+    "THINK_NOT_CHINESE": ("FormatChecker", "check_think", "Warning: <think>标签内的内容不是严格使用中文回答。"),
+    "ANSWER_MISSING": ("FormatChecker", "check_answer", "Error: 文本中没有找到<answer>标签。"),
+    "ANSWER_FORMAT": ("FormatChecker", "check_answer", "Warning: 答案格式不符合要求。"),
+    "LOGIC_PARSE": ("LogicChecker", "check", "无法从结果文本中解析出Ent和Fav分数"),
+}
+
+# 当前正在处理的数据行: (行号, 该行的问题代码列表)，线程与asyncio任务各自独立
+_current_row = contextvars.ContextVar("diagnostics_row", default=None)
+
+
+class Diagnostics:
+    """
+    记录检查过程中发现的问题: 最近的明细(行号、问题代码、截断到 detail_chars 个字符的问题文本)保存在有界环形缓冲区中,
+    同时累计各问题代码的出现次数, 在 row() 作用域内记录的问题代码还会归属到对应的数据行
+    """
+    detail_chars = 200
+
+    def __init__(self, maxlen=10000):
+        self._lock = threading.Lock()
+        self.records = deque(maxlen=maxlen)
+        self.counters = Counter()
+
+    @contextmanager
+    def row(self, row_id):
+        """在作用域内记录的问题归属到 row_id, 返回该行的问题代码列表"""
+        codes = []
+        token = _current_row.set((row_id, codes))
+        try:
+            yield codes
+        finally:
+            _current_row.reset(token)
+
+    def record(self, code, detail=None):
+        current = _current_row.get()
+        row_id = None
+        if current is not None:
+            row_id, codes = current
+            codes.append(code)
+        with self._lock:
+            self.records.append({"row": row_id, "code": code,
+                                 "detail": detail[:self.detail_chars] if isinstance(detail, str) else detail})
+            self.counters[code] += 1
+
+    def summary(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def recent(self, n=None):
+        with self._lock:
+            records = list(self.records)
+        return records if n is None else records[-n:]
+
+    def save(self, path):
+        """将缓冲区中的明细按行写入 jsonl 文件, 返回写入的条数"""
+        records = self.recent()
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return len(records)
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+            self.counters.clear()
+
+    @staticmethod
+    def format_codes(codes):
+        """输出列中使用的紧凑格式, 如 THINK_MISSING|LOGIC_PARSE"""
+        return "|".join(codes)
+
+    @staticmethod
+    def parse_codes(value):
+        if not isinstance(value, str) or not value:
+            return []
+        return value.split("|")
+
+    @staticmethod
+    def codes_of(codes, class_name, method_name):
+        """筛选出由指定检查方法产生的问题代码"""
+        return [code for code in codes if ISSUE_CODES.get(code, (None, None))[:2] == (class_name, method_name)]
+
+
+# 所有检查器共享的诊断记录
+DIAGNOSTICS = Diagnostics()
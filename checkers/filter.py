@@ -1,3 +1,5 @@
+import itertools
+import numpy as np
 import pandas as pd
 from collections import Counter
 
@@ -10,6 +12,12 @@ class Filter:
         '正确性得分': 10,
         '答案格式得分': 8
     }
+    thresholds = {
+        '困难等级': 0.2,
+        '正确性得分': 5,
+        '综合得分': 0.5
+    }
+    default_weights = [0.15, 0.1, 0.1, 0.01, 0.59, 0.05]
 
     def normalize_by_max(self, df):
         """按满分值比例归一化（0-1范围）"""
@@ -36,21 +44,184 @@ class Filter:
         best_indices = df.groupby('question')['综合得分'].idxmax()
         return df.loc[best_indices]
 
-    def filter_data(self, df):
+    def filter_data(self, df, thresholds=None):
+        thresholds = {**self.thresholds, **(thresholds or {})}
         return df[
-            (df['困难等级'] >= 0.2) &
-            (df['正确性得分'] >= 5) &
-            (df['综合得分'] >= 0.5) &
-            (df['RAG'] != '[]') &  
-            (df['RAG'].str.strip() != '[]')
+            (df['困难等级'] >= thresholds['困难等级']) &
+            (df['正确性得分'] >= thresholds['正确性得分']) &
+            (df['综合得分'] >= thresholds['综合得分']) &
+            self.rag_mask(df)
         ]
 
-    def filter(self, df, weights=None):
+    @staticmethod
+    def rag_mask(df):
+        """过滤掉RAG为空列表的数据"""
+        return (df['RAG'] != '[]') & (df['RAG'].str.strip() != '[]')
+
+    def filter(self, df, weights=None, thresholds=None):
         if weights is None:
-            weights = [0.15, 0.1, 0.1, 0.01, 0.59, 0.05]
+            weights = self.default_weights
         
         df = self.normalize_by_max(df)
         df = self.calculate_composite_score(df, weights=weights)
         df = self.select_top_per_question(df)
-        df = self.filter_data(df)
-        return df
\ No newline at end of file
+        df = self.filter_data(df, thresholds=thresholds)
+        return df
+
+    def sweep(self, df, weights=None, weight_grid=None, n_weights=1000, seed=0,
+              difficulty=None, correctness=None, composite=None, chunk_size=None, memory_budget_mb=256):
+        """
+        批量评估多组权重与阈值组合的过滤结果。
+        归一化得分矩阵与权重矩阵相乘得到所有权重下的综合得分, 再按问题分组向量化取最大值,
+        每组设置输出入选数量、与基线(weights + 默认阈值)的重合度以及入选综合得分的分布。
+        weight_grid 未给出时按 Dirichlet 分布随机采样 n_weights 组权重。
+        每次计算的权重组数 chunk_size 未给出时按行数与 memory_budget_mb 确定。
+        """
+        cols = list(self.max_scores.keys())
+        if weights is None:
+            weights = self.default_weights
+        if weight_grid is None:
+            rng = np.random.default_rng(seed)
+            weight_grid = rng.dirichlet(np.ones(len(cols)), size=n_weights)
+        weight_matrix = np.vstack([np.asarray(weights, dtype=float), np.asarray(weight_grid, dtype=float)])
+        if weight_matrix.shape[1] != len(cols):
+            raise ValueError("权重数量必须与评分项数量一致")
+
+        difficulty_cuts = difficulty or [self.thresholds['困难等级']]
+        correctness_cuts = correctness or [self.thresholds['正确性得分']]
+        composite_cuts = composite or [self.thresholds['综合得分']]
+        threshold_grid = list(itertools.product(difficulty_cuts, correctness_cuts, composite_cuts))
+
+        # 按问题排序, 使同组数据连续, 便于 reduceat 分组归约
+        codes, _ = pd.factorize(df['question'])
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        if len(order) == 0:
+            raise ValueError("没有可用于扫描的数据")
+        group_ids = codes[order]
+        starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+        row_group = np.cumsum(np.r_[True, group_ids[1:] != group_ids[:-1]]) - 1
+
+        scores = np.nan_to_num(df[cols].to_numpy(dtype=float)[order] / np.array([self.max_scores[c] for c in cols]))
+        difficulty_values = df['困难等级'].to_numpy(dtype=float)[order]
+        correctness_values = df['正确性得分'].to_numpy(dtype=float)[order]
+        rag_ok = self.rag_mask(df).to_numpy(dtype=bool)[order]
+        positions = np.arange(len(order))[None, :]
+
+        def select_best(weight_chunk):
+            # 按(权重组, 行)排列, 使分组归约与排序都沿连续内存进行
+            composite_scores = weight_chunk @ scores.T
+            group_max = np.maximum.reduceat(composite_scores, starts, axis=1)
+            is_max = composite_scores == group_max[:, row_group]
+            best = np.minimum.reduceat(np.where(is_max, positions, len(order)), starts, axis=1)
+            return best, group_max
+
+        def passes(best, group_max, difficulty_cut, correctness_cut, composite_cut):
+            return ((difficulty_values[best] >= difficulty_cut) &
+                    (correctness_values[best] >= correctness_cut) &
+                    (group_max >= composite_cut) &
+                    rag_ok[best])
+
+        base_best, base_max = select_best(weight_matrix[:1])
+        base_selected = passes(base_best, base_max, *(self.thresholds[k] for k in ['困难等级', '正确性得分', '综合得分']))
+        base_count = int(base_selected.sum())
+
+        if chunk_size is None:
+            chunk_size = self.sweep_chunk_size(len(order), memory_budget_mb)
+
+        reports = []
+        for start in range(0, len(weight_matrix), chunk_size):
+            weight_chunk = weight_matrix[start:start + chunk_size]
+            best, group_max = select_best(weight_chunk)
+            # 每组权重按组内最大综合得分排序一次, 入选行的取值与基线比较结果都按排序后的顺序取出, 各阈值共用;
+            # 排序后综合得分阈值对应每行的一个后缀, 其起点由阈值以下的个数给出
+            ranking = np.argsort(group_max, axis=1)
+            sorted_max = np.take_along_axis(group_max, ranking, axis=1)
+            best = np.take_along_axis(best, ranking, axis=1)
+            same_as_base = (best == base_best[0][ranking]) & base_selected[0][ranking]
+            chunk_difficulty = difficulty_values[best]
+            chunk_correctness = correctness_values[best]
+            chunk_rag = rag_ok[best]
+            del ranking, group_max, best
+            composite_starts = {cut: (sorted_max < cut).sum(axis=1) for cut in composite_cuts}
+
+            stats = []
+            for difficulty_cut, correctness_cut in itertools.product(difficulty_cuts, correctness_cuts):
+                selected = (chunk_difficulty >= difficulty_cut) & (chunk_correctness >= correctness_cut) & chunk_rag
+                stats.extend(self.suffix_stats(sorted_max, selected, same_as_base,
+                                               [composite_starts[cut] for cut in composite_cuts]))
+            # stats: (阈值组合, 统计量, 权重组), 阈值组合与 threshold_grid 顺序一致
+            stats = np.array(stats, dtype=float)
+            counts, overlaps = stats[:, 0], stats[:, 1]
+            unions = counts + base_count - overlaps
+
+            n_thresholds, n_chunk = len(threshold_grid), len(weight_chunk)
+            report = pd.DataFrame(np.tile(weight_chunk, (n_thresholds, 1)), columns=[f'权重_{col}' for col in cols])
+            report.insert(0, '权重编号', np.tile(np.arange(start, start + n_chunk), n_thresholds))
+            report['困难等级阈值'] = np.repeat([t[0] for t in threshold_grid], n_chunk)
+            report['正确性得分阈值'] = np.repeat([t[1] for t in threshold_grid], n_chunk)
+            report['综合得分阈值'] = np.repeat([t[2] for t in threshold_grid], n_chunk)
+            report['入选数量'] = counts.ravel().astype(int)
+            report['与基线重合数'] = overlaps.ravel().astype(int)
+            report['重合率'] = np.divide(overlaps, unions, out=np.ones_like(unions), where=unions > 0).ravel()
+            report['综合得分均值'] = stats[:, 2].ravel()
+            report['综合得分P50'] = stats[:, 3].ravel()
+            report['综合得分P90'] = stats[:, 4].ravel()
+            reports.append(report)
+
+        return pd.concat(reports, ignore_index=True)
+
+    @staticmethod
+    def sweep_chunk_size(rows, memory_budget_mb=256):
+        """
+        每组权重约占 rows*64 字节的临时数组(select_best 中的综合得分与位置索引, 排序后的组内最大值、
+        入选行的困难等级与正确性得分、排序索引, 以及每组阈值的掩码与累计计数/累计和),
+        按内存预算计算每次可同时计算的权重组数, 至少为1
+        """
+        return max(1, int(memory_budget_mb * (1 << 20) // (max(rows, 1) * 64)))
+
+    @staticmethod
+    def suffix_stats(sorted_values, mask, overlap_mask, starts, quantiles=(0.5, 0.9)):
+        """
+        sorted_values 每行已升序排列, 对 starts 中的每个起点, 按行统计该起点之后被 mask 选中的
+        个数、同时被 overlap_mask 选中的个数、均值与分位数(线性插值), 无选中时均值与分位数为NaN。
+        个数与均值由累计计数/累计和相减得到; 第 k 个(从0计)被选中的值位于累计计数首次超过 k 的位置, 按行二分查找
+        """
+        rows = np.arange(sorted_values.shape[0])
+        last = sorted_values.shape[1] - 1
+        cumulative = np.cumsum(mask, axis=1, dtype=np.int32)
+        cumulative_overlap = np.cumsum(mask & overlap_mask, axis=1, dtype=np.int32)
+        cumulative_sum = np.cumsum(np.where(mask, sorted_values, 0), axis=1)
+
+        def before(values, start):
+            return np.where(start > 0, values[rows, np.maximum(start - 1, 0)], 0)
+
+        def position_of(rank):
+            low = np.zeros(len(rows), dtype=int)
+            high = np.full(len(rows), last)
+            while (low < high).any():
+                middle = (low + high) // 2
+                # 已收敛的行(low == high)保持不变
+                active = low < high
+                right = active & (cumulative[rows, middle] <= rank)
+                low = np.where(right, middle + 1, low)
+                high = np.where(active & ~right, middle, high)
+            return sorted_values[rows, low]
+
+        results = []
+        for start in starts:
+            skipped = before(cumulative, start)
+            counts = cumulative[:, -1] - skipped
+            overlaps = cumulative_overlap[:, -1] - before(cumulative_overlap, start)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = (cumulative_sum[:, -1] - before(cumulative_sum, start)) / counts
+            stats = [counts, overlaps, means]
+            for q in quantiles:
+                pos = np.maximum(counts - 1, 0) * q
+                lower = np.floor(pos).astype(int)
+                upper = np.ceil(pos).astype(int)
+                lo = position_of(skipped + lower)
+                hi = position_of(skipped + upper)
+                stats.append(np.where(counts > 0, lo + (hi - lo) * (pos - lower), np.nan))
+            results.append(stats)
+        return results
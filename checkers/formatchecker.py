@@ -6,7 +6,6 @@ class FormatChecker(Evaluator):
     """
     用于检查文本中 <think> 和 <answer> 标签内容是否符合要求
     """
-    errors=[]
     def check_think(self, text,threshold):
         think_pattern = r"<think>(.*?)</think>"
         think_match = re.search(think_pattern, text, re.DOTALL)
@@ -17,9 +16,9 @@ class FormatChecker(Evaluator):
             if self.is_mostly_chinese(think_content, threshold):
                 score += 5  # 内容正确再加5分
             else:
-                self.errors.append("Warning: <think>标签内的内容不是严格使用中文回答。")
+                self.diagnostics.record("THINK_NOT_CHINESE", think_content)
         else:
-            self.errors.append("Error: 文本中没有找到<think>标签。")
+            self.diagnostics.record("THINK_MISSING", text)
         return score
 
     def check_answer(self, text):
@@ -36,9 +35,9 @@ class FormatChecker(Evaluator):
                 print(f"Stripped Answer: {stripped_answer}, Score: {score}")
                 return stripped_answer,score
             else:
-               self.errors.append(f"Warning: 答案格式不符合要求。")
+               self.diagnostics.record("ANSWER_FORMAT", answer_content)
         else:
-            self.errors.append("Error: 文本中没有找到<answer>标签。")
+            self.diagnostics.record("ANSWER_MISSING", text[-self.diagnostics.detail_chars:])
         return None,score
         
     @staticmethod
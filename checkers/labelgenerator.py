@@ -1,10 +1,16 @@
 # checkers/logic_checker.py
 from .base import Evaluator
+from .ragpruner import RAGPruner
+from .calibration import DifficultyCalibrator
 import re
+import math
 
 max_token=5000
 
 class LabelGenerator(Evaluator):
+    # compare_answers 评分的满分, 即完全正确
+    full_score = 10
+    
     def QA_difficulty(self,question,attempts,ref_ans):
         question=f"""{question}
 #回答上述问题请遵循以下要求：
@@ -27,7 +33,7 @@ class LabelGenerator(Evaluator):
         model_answers=[]
         for _ in range(attempts):
             inputokens=self.calc_text_token(question)    
-            model_answer = self.request_llm(question,16348-inputokens)
+            model_answer = self.request_llm(question,16348-inputokens,kind="LabelGenerator.QA_difficulty",prompt_tokens=inputokens)
             model_answers.append(model_answer)
             predict_answer = self.abstract_content(model_answer)
             if predict_answer == ref_ans:
@@ -58,8 +64,46 @@ class LabelGenerator(Evaluator):
             answer = -9999.0
         return answer
     
-    def LT_difficulty(self,question,passage,ref_ans,attempts):
-        question=f"""
+    def prune_passage(self, question, passage, top_k=None, token_budget=None):
+        """
+        按与问题的相关度只保留top_k个且总token数不超过token_budget的RAG段落，两者均为None时不裁剪
+        """
+        pruner = RAGPruner(top_k=top_k, token_budget=token_budget, count_tokens=self.calc_text_token)
+        return pruner.prune(question, passage)
+    
+    @staticmethod
+    def beta_cdf(x, a, b):
+        """整数参数Beta(a,b)分布在x处的累积概率, 等价于 P(Binomial(a+b-1, x) >= a)"""
+        n = a + b - 1
+        return sum(math.comb(n, j) * x ** j * (1 - x) ** (n - j) for j in range(a, n + 1))
+    
+    def is_correct(self, score):
+        """compare_answers 按0/5/10分评分, 满分(完全正确)才计为答对"""
+        return score is not None and score >= self.full_score
+    
+    def should_stop(self, scores, attempts, min_attempts=2, confidence=0.95, difficulty_cut=0.2):
+        """
+        序贯采样的停止规则, scores 为已完成采样的 compare_answers 评分, 困难等级是否达到过滤阈值 difficulty_cut 已经确定时停止:
+        1. 无论剩余采样结果如何, attempts 次采样后的结论都不会改变;
+        2. 通过率的后验分布(均匀先验)落在阈值同一侧的概率不低于 confidence。
+        """
+        made = len(scores)
+        correct_count = sum(1 for score in scores if self.is_correct(score))
+        if made >= attempts:
+            return True
+        if made < min_attempts:
+            return False
+        failures = made - correct_count
+        needed_failures = math.ceil(difficulty_cut * attempts - 1e-9)
+        if failures >= needed_failures or failures + (attempts - made) < needed_failures:
+            return True
+        prob_hard = self.beta_cdf(1 - difficulty_cut, correct_count + 1, failures + 1)
+        return prob_hard >= confidence or prob_hard <= 1 - confidence
+    
+    def lt_prompt(self, question, passage, rag_top_k=None, rag_token_budget=None):
+        """基于RAG段落作答的生成prompt, LT_difficulty 与 LT_difficulty_logprob 共用"""
+        passage = self.prune_passage(question, passage, rag_top_k, rag_token_budget)
+        return f"""
 [Passage]
 {passage}
 [Question]
@@ -77,13 +121,21 @@ class LabelGenerator(Evaluator):
 -<steps></steps>之间的内容应该是分点分步骤的，例如1.2.3.4
 -<result></result>之间的内容不允许分段
 """
+
+    def LT_difficulty(self,question,passage,ref_ans,attempts,rag_top_k=None,rag_token_budget=None,
+                      early_stop=False,min_attempts=2,confidence=0.95,difficulty_cut=0.2):
+        """
+        attempts 为最大采样次数; early_stop 为True时按 should_stop 提前结束采样,
+        返回的答案数即实际采样次数, 通过率按实际采样次数估计
+        """
+        question = self.lt_prompt(question, passage, rag_top_k, rag_token_budget)
         correct_count=0        
         model_answers=[]
         correct_score=[]
         processes=[]
+        inputokens=self.calc_text_token(question)    
         for _ in range(attempts):
-            inputokens=self.calc_text_token(question)    
-            model_answer = self.request_llm(question,16348-inputokens)
+            model_answer = self.request_llm(question,16348-inputokens,kind="LabelGenerator.LT_difficulty",prompt_tokens=inputokens)
             #print(model_answer,"\n")
             model_answers.append(model_answer)
             
@@ -91,13 +143,81 @@ class LabelGenerator(Evaluator):
             predict_answer = self.extract_result_content(model_answer)
             score,process=self.compare_answers(predict_answer,ref_ans)
             processes.append(process)
-            if score==15:
+            if self.is_correct(score):
                 print("\nOK\n")
                 correct_count += 1 
             correct_score.append(score)            
-        pass_rate = round(correct_count / attempts, 2)
+            if early_stop and self.should_stop(correct_score, attempts, min_attempts, confidence, difficulty_cut):
+                break
+        pass_rate = round(correct_count / len(model_answers), 2) if model_answers else 0
         
         return model_answers,correct_score,processes,pass_rate
+
+    @staticmethod
+    def result_confidence(token_logprobs):
+        """<result>标签内答案token的几何平均概率, 找不到答案或没有logprob时返回None"""
+        text = "".join(token for token, _ in token_logprobs)
+        match = re.search(r"<result>(.*?)</result>", text, re.DOTALL)
+        if match is None:
+            return None
+        start, end = match.span(1)
+        logprobs = []
+        offset = 0
+        for token, logprob in token_logprobs:
+            if offset < end and offset + len(token) > start and token.strip():
+                logprobs.append(logprob)
+            offset += len(token)
+        if not logprobs:
+            return None
+        return math.exp(sum(logprobs) / len(logprobs))
+
+    def logprob_samples(self,question,passage,ref_ans,attempts=1,rag_top_k=None,rag_token_budget=None):
+        """
+        生成时请求token logprob, 返回(model_answers, correct_score, processes, confidences):
+        置信度为<result>答案的概率, attempts>1 时与其他采样答案的一致率取平均, 都拿不到时为None
+        """
+        question = self.lt_prompt(question, passage, rag_top_k, rag_token_budget)
+        inputokens=self.calc_text_token(question)
+        model_answers=[]
+        correct_score=[]
+        processes=[]
+        confidences=[]
+        results=[]
+        for _ in range(attempts):
+            model_answer, token_logprobs = self.request_llm_logprobs(question,16348-inputokens,kind="LabelGenerator.LT_difficulty_logprob",
+                                                                       prompt_tokens=inputokens)
+            model_answers.append(model_answer)
+            confidences.append(self.result_confidence(token_logprobs))
+
+            predict_answer = self.extract_result_content(model_answer)
+            results.append(re.sub(r"\s+", "", predict_answer) if predict_answer else None)
+            score,process=self.compare_answers(predict_answer,ref_ans)
+            processes.append(process)
+            correct_score.append(score)
+
+        if attempts > 1:
+            for i, confidence in enumerate(confidences):
+                agreement = sum(1 for j, result in enumerate(results)
+                                if j != i and result is not None and result == results[i]) / (attempts - 1)
+                confidences[i] = agreement if confidence is None else (confidence + agreement) / 2
+        return model_answers,correct_score,processes,confidences
+
+    def LT_difficulty_logprob(self,question,passage,ref_ans,attempts=1,rag_top_k=None,rag_token_budget=None,
+                              calibration=None):
+        """
+        单次(或少量)采样估计困难等级: 每次采样的是否答对与置信度(见 logprob_samples)分别作为校准的输入,
+        通过率为各次采样估计的平均。calibration 为 calibrate_difficulty.py 拟合的校准文件,
+        未给出或文件不存在时答对按置信度、答错按0估计。返回值与 LT_difficulty 相同
+        """
+        model_answers,correct_score,processes,confidences = self.logprob_samples(
+            question, passage, ref_ans, attempts, rag_top_k, rag_token_budget)
+        calibrator = DifficultyCalibrator.cached(calibration)
+        estimates = [calibrator.predict(confidence, self.is_correct(score))
+                     for score, confidence in zip(correct_score, confidences)]
+        pass_rate = sum(estimates) / len(estimates) if estimates else 0
+
+        return model_answers,correct_score,processes,round(pass_rate, 2)
+
     def extract_result_content(self,content):
         pattern = r"<result>(.*?)</result>"  # 非贪婪匹配，匹配任意字符（包括换行）
         match = re.search(pattern, content, re.DOTALL)  # re.DOTALL 使 . 能匹配换行符
@@ -124,7 +244,8 @@ class LabelGenerator(Evaluator):
 -<result></result>之间的内容只应该是得分，即数值
 """
         inputokens=self.calc_text_token(question)    
-        model_answer = self.request_llm(question,16348-inputokens,temperature=0.3)
+        model_answer = self.request_llm(question,16348-inputokens,temperature=0.3,kind="LabelGenerator.compare_answers",
+                                        prompt_tokens=inputokens)
         stripped_answer = self.extract_result_content(model_answer)
         #print("得分:",stripped_answer)
         if not stripped_answer:  # 如果是 None 或空字符串
@@ -6,7 +6,6 @@ class LogicChecker(Evaluator):
     """
     用于评估答案思考过程的逻辑正确性和支持度
     """
-    errors=[]
     def check(self,reasoning_process):
         template=f"""
 ### 评分过程请使用中文
@@ -67,7 +66,7 @@ Fav Calculation: (0+1+1+1+1) / (6-1) = 4 / 5 = 0.8
 
 """
         inputokens=self.calc_text_token(template)
-        result_score = self.request_llm(template, 16348-inputokens)
+        result_score = self.request_llm(template, 16348-inputokens, kind="LogicChecker.check", prompt_tokens=inputokens)
 
         fav_score, ent_score = self.parse_result(result_score)  # 需要实现parse_result方法来解析结果
         
@@ -84,6 +83,6 @@ Fav Calculation: (0+1+1+1+1) / (6-1) = 4 / 5 = 0.8
             return fav_score, ent_score
         else:
             # 如果没有找到匹配的模式，返回默认值或抛出异常
-            self.errors.append("无法从结果文本中解析出Ent和Fav分数")    
+            self.diagnostics.record("LOGIC_PARSE", result_text[-self.diagnostics.detail_chars:])
             return -1,-1
     
\ No newline at end of file
@@ -0,0 +1,116 @@
+# checkers/ragpruner.py
+import re
+import ast
+import json
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+# 不同实例共享的裁剪结果缓存: (问题, 段落)哈希 + 裁剪参数 -> 保留的段落下标
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_CACHE_SIZE = 10000
+
+
+class RAGPruner:
+    """
+    在构造prompt之前按与问题的相关度对RAG段落排序, 只保留token预算内的top-k段落。
+    相关度使用进程内的BM25, 中文按单字与相邻二字切分, 英文与数字按词切分。
+    """
+    def __init__(self, top_k=None, token_budget=None, count_tokens=None, k1=1.5, b=0.75):
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens or len
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def parse_passages(passage):
+        """解析 [{'id': ..., 'text': ...}, ...] 形式的RAG字段, 返回(段落列表, 是否为JSON格式), 无法解析时段落列表为None"""
+        if isinstance(passage, list):
+            return passage, False
+        if not isinstance(passage, str):
+            return None, False
+        for loader, is_json in ((json.loads, True), (ast.literal_eval, False)):
+            try:
+                chunks = loader(passage)
+            except (ValueError, SyntaxError, TypeError):
+                continue
+            if isinstance(chunks, list) and all(isinstance(c, dict) and 'text' in c for c in chunks):
+                return chunks, is_json
+        return None, False
+
+    @staticmethod
+    def tokenize(text):
+        """中文取单字和二字组合, 英文单词与数字整体作为一个词"""
+        terms = []
+        for segment in re.findall(r'[\u4e00-\u9fff]+|[a-zA-Z]+|[0-9]+(?:\.[0-9]+)?', str(text)):
+            if '\u4e00' <= segment[0] <= '\u9fff':
+                terms.extend(segment)
+                terms.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+            else:
+                terms.append(segment.lower())
+        return terms
+
+    def rank(self, question, chunks):
+        """返回按BM25得分从高到低排列的段落下标"""
+        docs = [Counter(self.tokenize(chunk.get('text', ''))) for chunk in chunks]
+        lengths = [sum(doc.values()) for doc in docs]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 0
+        doc_freq = Counter(term for doc in docs for term in doc)
+        query = set(self.tokenize(question))
+
+        scores = []
+        for doc, length in zip(docs, lengths):
+            score = 0.0
+            for term in query:
+                tf = doc.get(term, 0)
+                if tf == 0:
+                    continue
+                idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                score += idf * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+
+    def select(self, question, chunks):
+        """按排序结果依次选取段落, 直到达到top_k或token预算(得分最高的段落总会保留)"""
+        selected = []
+        used_tokens = 0
+        for index in self.rank(question, chunks):
+            if self.top_k is not None and len(selected) >= self.top_k:
+                break
+            tokens = self.count_tokens(str(chunks[index].get('text', '')))
+            if self.token_budget is not None and selected and used_tokens + tokens > self.token_budget:
+                continue
+            selected.append(index)
+            used_tokens += tokens
+        # 保持段落在原文中的顺序
+        return sorted(selected)
+
+    def prune(self, question, passage):
+        """返回裁剪后的RAG字段, 格式与输入保持一致; 无法解析时原样返回"""
+        if self.top_k is None and self.token_budget is None:
+            return passage
+        chunks, is_json = self.parse_passages(passage)
+        if not chunks:
+            return passage
+
+        digest = hashlib.sha1(f"{question}\x00{passage}".encode("utf-8")).hexdigest()
+        key = (digest, self.top_k, self.token_budget)
+        with _CACHE_LOCK:
+            selected = _CACHE.get(key)
+            if selected is not None:
+                _CACHE.move_to_end(key)
+        if selected is None:
+            selected = self.select(question, chunks)
+            with _CACHE_LOCK:
+                _CACHE[key] = selected
+                if len(_CACHE) > _CACHE_SIZE:
+                    _CACHE.popitem(last=False)
+
+        kept = [chunks[i] for i in selected]
+        if isinstance(passage, list):
+            return kept
+        return json.dumps(kept, ensure_ascii=False) if is_json else str(kept)
@@ -0,0 +1,94 @@
+# checkers/scheduler.py
+import math
+import time
+import heapq
+import itertools
+import threading
+from collections import defaultdict, deque
+
+
+class RequestScheduler:
+    """
+    LLM请求调度器, 位于 Evaluator.request_llm 之前, 限制同时发送的请求数。
+    每个请求按 输入token数 + 预计输出token数 分到以2为底的长度桶中, 调度时优先发送预计最短的请求(sejf),
+    同一桶内先到先发; 等待时间按 aging 个token/秒 折算为优先级, 避免长请求一直得不到调度。
+    policy="fifo" 时按到达顺序发送, 用于对比。
+    """
+    def __init__(self, max_concurrency=8, aging=500.0, policy="sejf", default_output_tokens=1024,
+                 ema_alpha=0.2, history=10000):
+        if policy not in ("sejf", "fifo"):
+            raise ValueError(f"Unsupported scheduler policy: {policy}")
+        self.max_concurrency = max_concurrency
+        self.aging = aging
+        self.policy = policy
+        self.default_output_tokens = default_output_tokens
+        self.ema_alpha = ema_alpha
+
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = 0
+        self._seq = itertools.count()
+        self._expected_output = {}
+        self._waits = defaultdict(lambda: deque(maxlen=history))
+
+    def expected_output_tokens(self, kind, max_tokens):
+        """按同类请求实际输出token数的滑动平均估计, 尚无记录时取默认值"""
+        with self._cond:
+            expected = self._expected_output.get(kind, self.default_output_tokens)
+        return min(expected, max_tokens) if max_tokens else expected
+
+    def observe(self, kind, output_tokens):
+        """记录一次请求的实际输出token数"""
+        with self._cond:
+            previous = self._expected_output.get(kind)
+            if previous is None:
+                self._expected_output[kind] = output_tokens
+            else:
+                self._expected_output[kind] = (1 - self.ema_alpha) * previous + self.ema_alpha * output_tokens
+
+    @staticmethod
+    def bucket_of(tokens):
+        return max(0, int(math.log2(max(tokens, 1))))
+
+    def run(self, fn, prompt_tokens, max_tokens=None, kind=None):
+        """排队等待调度后在当前线程执行 fn 并返回其结果"""
+        expected = prompt_tokens + self.expected_output_tokens(kind, max_tokens)
+        bucket = self.bucket_of(expected)
+        enqueued = time.monotonic()
+        if self.policy == "sejf":
+            # 优先级 = 桶的token下界 - aging * 等待秒数, 展开后只与入队时间有关, 可以直接放入堆中
+            priority = 2 ** bucket + self.aging * enqueued
+        else:
+            priority = enqueued
+        ticket = (priority, next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            while self._running >= self.max_concurrency or self._waiting[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._running += 1
+            self._waits[bucket].append(time.monotonic() - enqueued)
+            self._cond.notify_all()
+
+        try:
+            return fn()
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def report(self):
+        """各长度桶的请求数、平均与P95排队时间(秒)"""
+        with self._cond:
+            waits = {bucket: sorted(values) for bucket, values in self._waits.items()}
+        stats = {}
+        for bucket, values in sorted(waits.items()):
+            if not values:
+                continue
+            stats[f"{2 ** bucket}-{2 ** (bucket + 1) - 1} tokens"] = {
+                "count": len(values),
+                "mean_wait": round(sum(values) / len(values), 3),
+                "p95_wait": round(values[min(len(values) - 1, int(math.ceil(0.95 * len(values))) - 1)], 3),
+            }
+        return stats
@@ -0,0 +1,127 @@
+import re
+import csv
+import zlib
+import numpy as np
+from typing import Dict, List, Any, Tuple, Optional, Hashable
+
+
+class MinHashLSH:
+    """
+    基于MinHash签名与LSH分桶的近重复检测。
+    分桶键由调用方给出的前缀(如参考答案、问题中的数字)、band序号与该band的签名组成,
+    只有前缀相同且至少一个band签名完全相同的样本才会互为候选。
+    """
+    def __init__(self, num_perm: int = 128, bands: Optional[int] = None, threshold: float = 0.7, seed: int = 0):
+        if bands is None:
+            bands = self.choose_bands(num_perm, threshold)
+        if num_perm % bands != 0:
+            raise ValueError("num_perm必须能被bands整除")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = {}
+        # multiply-shift哈希族: h(x) = ((a * x + b) mod 2^64) >> 32, a为奇数
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def choose_bands(num_perm: int, threshold: float) -> int:
+        """
+        b个band、每band r行时, 相似度s的样本成为候选的概率为 1-(1-s^r)^b, 在 (1/b)^(1/r) 附近陡增。
+        在 num_perm 的约数中选取该拐点最接近 threshold 的band数(128位签名、阈值0.7时为16个band×8行)
+        """
+        divisors = [b for b in range(1, num_perm + 1) if num_perm % b == 0]
+        return min(divisors, key=lambda b: abs((1 / b) ** (b / num_perm) - threshold))
+
+    @staticmethod
+    def shingles(text: str, size: int) -> set:
+        """去掉空白与标点后按字符size-gram切分"""
+        text = re.sub(r'[^0-9a-zA-Z\u4e00-\u9fff]', '', str(text)).lower()
+        if len(text) <= size:
+            return {text}
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+    def signature(self, text: str, size: int) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in self.shingles(text, size)), dtype=np.uint64)
+        return ((np.outer(hashes, self.a) + self.b) >> np.uint64(32)).min(axis=0)
+
+    def keys(self, prefix: Hashable, sig: np.ndarray) -> List[Tuple]:
+        return [(prefix, band, sig[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def query(self, prefix: Hashable, sig: np.ndarray) -> List[int]:
+        """返回与签名在任一band内同桶的已登记样本(按序号排序)"""
+        found = set()
+        for key in self.keys(prefix, sig):
+            found.update(self.buckets.get(key, ()))
+        return sorted(found)
+
+    def insert(self, prefix: Hashable, sig: np.ndarray, index: int) -> None:
+        for key in self.keys(prefix, sig):
+            self.buckets.setdefault(key, []).append(index)
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """估计的Jaccard相似度"""
+        return float(np.mean(sig_a == sig_b))
+
+
+def cluster_examples(examples: List[Dict[str, Any]], threshold: float = 0.7, passage_threshold: float = 0.9,
+                     num_perm: int = 128, bands: Optional[int] = None, question_shingle: int = 2, passage_shingle: int = 5
+                     ) -> Tuple[Dict[int, int], List[Dict[str, Any]]]:
+    """
+    将问题相似度>=threshold、段落相似度>=passage_threshold、参考答案相同且问题中数字(年份、金额等)一致的样本聚为一簇。
+    每个成员都与所在簇的代表样本直接满足上述条件(不做传递合并), 有多个可选代表时归入问题最相似的一个。
+    bands 未给出时按 threshold 选取(见 MinHashLSH.choose_bands)。
+    返回 样本序号->代表样本序号 的映射(代表为簇内序号最小的样本)以及审计记录,
+    审计记录的 candidates 为该样本比较过的候选代表数。
+    """
+    lsh = MinHashLSH(num_perm=num_perm, bands=bands, threshold=threshold)
+    question_sigs = [lsh.signature(example["question"], question_shingle) for example in examples]
+    passage_sigs = [lsh.signature(example["RAG"], passage_shingle) for example in examples]
+    # 参考答案与问题中的数字必须完全一致, 直接作为分桶键的前缀, 同模板但年份、公司不同的问题不会落入同一个桶
+    prefixes = [(str(example["answer"]).strip(), tuple(sorted(set(re.findall(r'\d+(?:\.\d+)?', str(example["question"]))))))
+                for example in examples]
+
+    def matches(i, rep):
+        """样本 i 与代表样本 rep 满足全部聚类条件"""
+        if lsh.similarity(question_sigs[i], question_sigs[rep]) < threshold:
+            return False
+        return lsh.similarity(passage_sigs[i], passage_sigs[rep]) >= passage_threshold
+
+    # 按序号依次处理: 桶中只登记代表样本, 每个样本只与同桶的代表比较, 不满足条件则自成一簇并登记。
+    # 成员只挂到与其直接满足条件的代表样本上, 避免相似关系传递导致簇内样本与代表相差过远
+    representatives = {}
+    compared = {}
+    for index in range(len(examples)):
+        reps = lsh.query(prefixes[index], question_sigs[index])
+        compared[index] = len(reps)
+        candidates = [rep for rep in reps if matches(index, rep)]
+        if candidates:
+            representatives[index] = max(candidates, key=lambda rep: (lsh.similarity(question_sigs[index], question_sigs[rep]), -rep))
+        else:
+            representatives[index] = index
+            lsh.insert(prefixes[index], question_sigs[index], index)
+    cluster_ids = {rep: cid for cid, rep in enumerate(sorted(set(representatives.values())))}
+    audit = []
+    for index, rep in representatives.items():
+        audit.append({
+            'cluster_id': cluster_ids[rep],
+            'representative': rep,
+            'index': index,
+            'question_similarity': round(lsh.similarity(question_sigs[index], question_sigs[rep]), 4),
+            'passage_similarity': round(lsh.similarity(passage_sigs[index], passage_sigs[rep]), 4),
+            'candidates': compared[index],
+            'question': examples[index]["question"],
+        })
+    return representatives, audit
+
+
+def save_audit(report_path: str, audit: List[Dict[str, Any]]) -> None:
+    """保存聚类审计报告，每个原始样本一行"""
+    if not audit:
+        return
+    with open(report_path, mode='w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(audit[0].keys()))
+        writer.writeheader()
+        writer.writerows(sorted(audit, key=lambda record: (record['cluster_id'], record['index'])))
@@ -5,12 +5,26 @@ import os
 import csv
 import importlib
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from typing import Dict, List, Any, Tuple
+from provenance import (method_fingerprint, method_columns, load_provenance, save_provenance,
+                        is_reusable, row_key, file_digest)
+from dedup import cluster_examples, save_audit
+from checkers.diagnostics import DIAGNOSTICS
+from checkers.scheduler import RequestScheduler
+from checkers.base import Evaluator
+from records import RecordBatch, columns_for, FIELDS_BY_COLUMN
+from sampling import stratified_sample, sample_config, quality_report
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 生成COT并估计困难等级的 LabelGenerator 方法，两者输出相同的列
+GENERATION_METHODS = ("LT_difficulty", "LT_difficulty_logprob")
+
 def load_config(config_path: str) -> Dict[str, Any]:
     """加载并验证配置文件"""
     if not os.path.exists(config_path):
@@ -29,6 +43,10 @@ def load_config(config_path: str) -> Dict[str, Any]:
 
 def load_data(data_path: str) -> List[Dict[str, Any]]:
     """加载数据集"""
+    return load_frame(data_path).to_dict('records')
+
+def load_frame(data_path: str) -> pd.DataFrame:
+    """加载数据表"""
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"Data path not found: {data_path}")
     
@@ -40,7 +58,7 @@ def load_data(data_path: str) -> List[Dict[str, Any]]:
             df = pd.read_excel(data_path)
         else:
             raise ValueError(f"Unsupported file format: {ext}")
-        return df.to_dict('records')
+        return df
     except Exception as e:
         raise ValueError(f"Error loading data: {str(e)}")
 
@@ -59,7 +77,7 @@ def initialize_checker(checker_cfg: Dict[str, Any]) -> Any:
         raise
 
 def process_method(checker_instance, method_cfg, example, input_path=" ", output_path=" "):
-    """处理单个检查方法"""
+    """处理单个检查方法，example 为 CotRecord，返回 字段名 -> 结果"""
     method_name = method_cfg["method_name"]
     if not hasattr(checker_instance, method_name):
         raise AttributeError(f"Method {method_name} not found in {checker_instance.__class__.__name__}")
@@ -77,41 +95,45 @@ def process_method(checker_instance, method_cfg, example, input_path=" ", output
             
         if checker_instance.__class__.__name__ == "FormatChecker":
             if method_name == "check_think":
-                score = method_to_call(example["COT答案"], **params)
-                return {"思考格式得分": score}
+                score = method_to_call(example.cot, **params)
+                return {"think_format": score}
             elif method_name == "check_answer":
-                stripped_answer, score = method_to_call(example["COT答案"], **params)
+                stripped_answer, score = method_to_call(example.cot, **params)
                 return {
-                    "答案格式得分": score
+                    "answer_format": score
                 }
                 
         elif checker_instance.__class__.__name__ == "LogicChecker":
             if method_name == "check":
-                logic_thinking, logic_fav_score, logic_ent_score = method_to_call(example["answer"], **params)
+                logic_thinking, logic_fav_score, logic_ent_score = method_to_call(example.answer, **params)
                 return {
-                    "逻辑打分过程": logic_thinking,
-                    "句间逻辑支持得分": logic_fav_score,
-                    "问答逻辑蕴含得分": logic_ent_score
+                    "logic_process": logic_thinking,
+                    "logic_fav": logic_fav_score,
+                    "logic_ent": logic_ent_score
                 }
                 
         elif checker_instance.__class__.__name__ == "ReflectionChecker":
             if method_name == "check":
-                score = method_to_call(example["COT答案"], **params)
-                return {"自我反思得分": score}
+                score = method_to_call(example.cot, **params)
+                return {"reflection": score}
                 
         elif checker_instance.__class__.__name__ == "CorrectnessChecker":
+            # 只比较COT中<result>标签内的答案，结果写入单独的列，不覆盖生成阶段的正确性得分
+            predict_answer = checker_instance.extract_result_content(example.cot or "")
             if method_name == "check":
-                # 使用FormatChecker处理后的stripped_answer
-                stripped_answer = example.get("stripped_answer", example["COT答案"])
-                score = method_to_call(stripped_answer, example["answer"], **params)
-                return {"正确性得分": score}
+                score = method_to_call(predict_answer, example.answer, **params)
+                return {"exact_match": score}
+            elif method_name == "compare_answers":
+                score = method_to_call(predict_answer, example.answer, **params)
+                return {"correct_review": score}
             
         elif checker_instance.__class__.__name__ == "Filter":
             if method_name == "filter":
                 res = method_to_call(example, **params)
                 return res
                    
-        return {f"{checker_instance.__class__.__name__}_{method_name}": "空result"}
+        logger.warning(f"{checker_instance.__class__.__name__}.{method_name} has no output columns")
+        return {}
         
     except Exception as e:
         logger.error(f"Error processing {method_name}: {str(e)}")
@@ -119,6 +141,10 @@ def process_method(checker_instance, method_cfg, example, input_path=" ", output
     
 def save_results(output_path, fieldnames, answer_record):
     """保存结果到文件（自动处理表头）"""
+    save_rows(output_path, fieldnames, [answer_record])
+
+def save_rows(output_path, fieldnames, rows):
+    """追加保存多行结果，只打开一次文件"""
     # 检查文件是否存在
     file_exists = os.path.exists(output_path)
     
@@ -129,10 +155,85 @@ def save_results(output_path, fieldnames, answer_record):
         if not file_exists or os.stat(output_path).st_size == 0:
             writer.writeheader()
         
-        writer.writerow(answer_record)
+        writer.writerows(rows)
     
-def main(config_path: str) -> None:
-    """主执行流程"""
+def run_label_generator(checker_instance, method_cfg, example):
+    """运行 LabelGenerator 的生成方法，返回(model_answers, correct_score, processes, pass_rate)"""
+    method_to_call = getattr(checker_instance, method_cfg["method_name"])
+    params = method_cfg.get("params", {})
+    return method_to_call(example["question"], example["RAG"], example["answer"], **params)
+
+def build_cot_records(example, outputs) -> RecordBatch:
+    """将一条RAG样本的生成结果展开为每个COT答案一条记录"""
+    model_answers,correct_score,processes,pass_rate = outputs
+    batch = RecordBatch()
+    for i,ans in enumerate(model_answers):
+        batch.append(
+            question=example["question"],
+            rag=example["RAG"],
+            answer=example["answer"],
+            difficulty=round(1 - pass_rate, 2),
+            cot=ans,
+            correct=correct_score[i],
+            process=processes[i] if i < len(processes) else None,
+            attempts=len(model_answers)
+        )
+    return batch
+
+def evaluate_example(index, batch, method_plans, old_batch, old_index):
+    """对第 index 条COT记录运行所有评估方法，结果写回 batch，指纹未变化的字段从已有结果中复用；出错时返回False"""
+    try:
+        record = batch.records[index]
+        old = old_index.get(row_key(record.question, record.cot))
+        
+        # 处理所有评估方法，检查中发现的问题代码记录到该行
+        with DIAGNOSTICS.row(index) as issues:
+            for checker_instance, method_cfg, fields, reuse in method_plans:
+                if reuse and old is not None and not any(old_batch.is_missing(old, field) for field in fields):
+                    batch.set(index, **{field: old_batch.get(old, field) for field in fields})
+                    # 复用字段时一并沿用该方法此前记录的问题代码
+                    issues.extend(DIAGNOSTICS.codes_of(DIAGNOSTICS.parse_codes(old_batch.get(old, 'diagnostics')),
+                                                       checker_instance.__class__.__name__, method_cfg["method_name"]))
+                    continue
+                
+                method_result = process_method(checker_instance, method_cfg, record)
+                batch.set(index, **method_result)
+        batch.set(index, diagnostics=DIAGNOSTICS.format_codes(issues))
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error processing example: {str(e)}")
+        return False
+
+def timed(fn, *args):
+    """执行 fn 并返回(结果, 耗时秒数)"""
+    started = time.monotonic()
+    result = fn(*args)
+    return result, time.monotonic() - started
+
+def map_rows(fn, items, workers: int = 1):
+    """按顺序逐个返回 fn 在每个元素上的结果，workers>1 时多线程并发执行，同时提交的行数不超过 2*workers"""
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+
+def log_latency(stage: str, latencies: List[float]) -> None:
+    """输出单行完成耗时的P50/P95"""
+    if not latencies:
+        return
+    quantiles = pd.Series(latencies).quantile([0.5, 0.95])
+    logger.info(f"{stage}: {len(latencies)} rows, p50 {quantiles[0.5]:.2f}s, p95 {quantiles[0.95]:.2f}s")
+
+def main(config_path: str, sample_size: int = None) -> None:
+    """主执行流程，sample_size 给出时只对分层抽样的样本运行并输出质量估计"""
     try:
         # 1. 加载配置
         config = load_config(config_path)
@@ -142,91 +243,162 @@ def main(config_path: str) -> None:
         examples = load_data(config["data_path"])
         logger.info(f"Loaded {len(examples)} RAG examples")
         
+        # 抽样评估：分层抽取部分样本，结果写到单独的目录
+        sampling_cfg = dict(config.get("sampling", {}))
+        if sample_size:
+            sampling_cfg.update(enabled=True, size=sample_size)
+        sample = None
+        if sampling_cfg.get("enabled", False):
+            sample = stratified_sample(examples, sampling_cfg.get("size", 200), key=sampling_cfg.get("stratify_key"),
+                                       n_buckets=sampling_cfg.get("n_buckets", 4),
+                                       min_per_stratum=sampling_cfg.get("min_per_stratum", 2),
+                                       seed=sampling_cfg.get("seed", 0))
+            examples = [examples[i] for i in sample.indices]
+            config = sample_config(config, sampling_cfg.get("output_dir"))
+            logger.info(f"Sampled {len(examples)} examples from {len(sample.population)} strata, writing to {os.path.dirname(config['cot_path'])}")
+        
+        # 按长度分桶的请求调度，启用时各阶段按行并发执行
+        scheduler_cfg = config.get("scheduler", {})
+        scheduler = None
+        row_workers = 1
+        if scheduler_cfg.get("enabled", False):
+            scheduler_params = {k: v for k, v in scheduler_cfg.items() if k not in ("enabled", "row_workers")}
+            scheduler = RequestScheduler(**scheduler_params)
+            row_workers = scheduler_cfg.get("row_workers", 2 * scheduler.max_concurrency)
+            Evaluator.scheduler = scheduler
+        
         # 2.5 生成COT
         cot_path = config["cot_path"]
-        fieldnames = ['question', 'RAG', 'answer', '困难等级','COT答案',  '正确性得分', '正确性过程']
+        fieldnames = ['question', 'RAG', 'answer', '困难等级','COT答案',  '正确性得分', '正确性过程', '采样次数']
+        cot_columns = columns_for(fieldnames)
         
-        for example in examples:
-            for checker_cfg in config["checkers"]:
-                if checker_cfg["class_name"] =="LabelGenerator":
-                    checker_instance = initialize_checker(checker_cfg)
-                    for method_cfg in checker_cfg["methods"]:
-                        
-                        if not method_cfg.get("enabled", True) or "method_name" not in method_cfg:
-                            continue     
-                        
-                        if checker_instance.__class__.__name__ == "LabelGenerator":
-                            method_name = method_cfg["method_name"]
-                            method_to_call = getattr(checker_instance, method_name)
-                            params = method_cfg.get("params", {})
-                            
-                            if method_name == "LT_difficulty":
-                                model_answers,correct_score,processes,pass_rate = method_to_call(
-                                    example["question"],
-                                    example["RAG"],
-                                    example["answer"], 
-                                    **params)
-
-                                for i,ans in enumerate(model_answers):
-                                    answer_record = {
-                                        'question': example["question"],
-                                        'RAG': example["RAG"],
-                                        'answer': example["answer"],
-                                        '困难等级': round(1 - pass_rate, 2),
-                                        'COT答案': ans,                                       
-                                        '正确性得分': correct_score[i],
-                                        '正确性过程': processes[i] if i < len(processes) else None
-                                    }
-                                    save_results(cot_path,fieldnames,answer_record)
+        # 生成列的指纹(包括输入数据与聚类配置)未变化时直接复用已有的COT数据
+        generation_fp = None
+        generation_extra = {"data": file_digest(config["data_path"]), "dedup": config.get("dedup")}
+        if sample is not None:
+            generation_extra["sample"] = {k: v for k, v in sampling_cfg.items() if k not in ("enabled", "output_dir", "confidence")}
+        label_plan = None
+        for checker_cfg in config["checkers"]:
+            if checker_cfg["class_name"] == "LabelGenerator":
+                for method_cfg in checker_cfg["methods"]:
+                    if method_cfg.get("enabled", True) and method_cfg.get("method_name") in GENERATION_METHODS:
+                        extra = generation_extra
+                        calibration = method_cfg.get("params", {}).get("calibration")
+                        if calibration:
+                            # 校准文件重新拟合后困难等级同样需要重新计算
+                            extra = {**generation_extra, "calibration": file_digest(calibration)}
+                        generation_fp = method_fingerprint("LabelGenerator", method_cfg, extra=extra)
+                        label_plan = (checker_cfg, method_cfg)
+        generation_columns = method_columns("LabelGenerator", label_plan[1]["method_name"]) if label_plan else []
+        reuse_cot = generation_fp is not None and is_reusable(load_provenance(cot_path), generation_columns, generation_fp)
+        
+        if reuse_cot:
+            logger.info(f"COT columns unchanged, reusing {cot_path}")
+        elif generation_fp is not None and os.path.exists(cot_path):
+            # 旧数据由不同的配置生成，备份后重新生成
+            os.replace(cot_path, f"{cot_path}.bak")
+            logger.info(f"COT columns changed, previous results moved to {cot_path}.bak")
+        
+        generation_examples = [] if reuse_cot or label_plan is None else examples
+        
+        # 近重复问题聚类：每簇只对代表样本生成与评判，结果复用到簇内其他样本
+        dedup_cfg = config.get("dedup", {})
+        representatives = {}
+        shared_results = {}
+        if generation_examples and dedup_cfg.get("enabled", False):
+            dedup_params = {k: v for k, v in dedup_cfg.items() if k not in ("enabled", "report_path")}
+            representatives, audit = cluster_examples(generation_examples, **dedup_params)
+            report_path = dedup_cfg.get("report_path", os.path.join(os.path.dirname(cot_path), "dedup_report.csv"))
+            save_audit(report_path, audit)
+            logger.info(f"Clustered {len(generation_examples)} examples into {len(set(representatives.values()))} groups, audit saved to {report_path}")
+        shared_representatives = {rep for idx, rep in representatives.items() if idx != rep}
+        
+        if generation_examples:
+            label_generator = initialize_checker(label_plan[0])
+            generate_indices = [index for index in range(len(generation_examples)) if representatives.get(index, index) == index]
+            latencies = []
+            for index, (outputs, elapsed) in zip(generate_indices, map_rows(
+                    lambda index: timed(run_label_generator, label_generator, label_plan[1], generation_examples[index]),
+                    generate_indices, row_workers)):
+                latencies.append(elapsed)
+                save_rows(cot_path, fieldnames, build_cot_records(generation_examples[index], outputs).to_rows(cot_columns))
+                if index in shared_representatives:
+                    shared_results[index] = outputs
+            
+            # 簇内其他样本直接使用代表样本的结果
+            for index, representative in representatives.items():
+                if index != representative:
+                    save_rows(cot_path, fieldnames,
+                              build_cot_records(generation_examples[index], shared_results[representative]).to_rows(cot_columns))
+            log_latency("COT generation", latencies)
                                         
+        if generation_fp is not None and not reuse_cot:
+            save_provenance(cot_path, {col: generation_fp for col in generation_columns})
         logger.info(f"lable and grade success! ")
         
                                     
         # 3. 处理所有检查器
-        examples = load_data(config["cot_path"])
-        logger.info(f"Loaded {len(examples)} cot examples")
+        cot_batch = RecordBatch.from_frame(load_frame(config["cot_path"]))
+        logger.info(f"Loaded {len(cot_batch)} cot examples")
+        # 诊断计数与明细只统计本阶段
+        DIAGNOSTICS.clear()
         intermediate_path = config["intermediate_path"] 
-        fieldnames = ['question', 'RAG', 'answer', '困难等级','COT答案',  '正确性得分', '正确性过程', '思考格式得分', '逻辑打分过程', '问答逻辑蕴含得分','句间逻辑支持得分', '自我反思得分', '答案格式得分']
-        for example in examples:
-            try:
-                result = {
-                    'question': example["question"],
-                    'RAG': example["RAG"],
-                    'answer': example["answer"],
-                    '困难等级': example["困难等级"],
-                    'COT答案': example["COT答案"],
-                    '正确性得分': example["正确性得分"],
-                    '正确性过程': example["正确性过程"]
-                }
-                
-                # 处理所有评估器
-                for checker_cfg in config["checkers"]:
-                    if "class_name" not in checker_cfg or "methods" not in checker_cfg:
-                        continue
-                     
-                    if checker_cfg["class_name"]=="Filter" or checker_cfg["class_name"]=="LabelGenerator" or checker_cfg["class_name"]=="CorrectnessChecker":
-                        continue
-                    
-                    
-                    # 初始化评估器
-                    checker_instance = initialize_checker(checker_cfg)
-                    
-                    # 处理所有评估方法
-                    for method_cfg in checker_cfg["methods"]:
-                        if not method_cfg.get("enabled", True) or "method_name" not in method_cfg:
-                            continue
-                            
-                        method_result = process_method(checker_instance, method_cfg, example)
-                        result.update(method_result)
-
-                    save_results(intermediate_path,fieldnames,result)
-                
-            except Exception as e:
-                logger.error(f"Error processing example: {str(e)}")
+        fieldnames = ['question', 'RAG', 'answer', '困难等级','COT答案',  '正确性得分', '正确性过程', '采样次数', '思考格式得分', '逻辑打分过程', '问答逻辑蕴含得分','句间逻辑支持得分', '自我反思得分', '答案格式得分', '答案一致得分', '正确性复核得分', '诊断代码']
+        
+        # 读取已有的中间结果及其列指纹，指纹未变化的列直接复用
+        old_provenance = load_provenance(intermediate_path)
+        old_batch = RecordBatch.from_frame(load_frame(intermediate_path)) if old_provenance else RecordBatch()
+        old_index = {row_key(record.question, record.cot): i for i, record in enumerate(old_batch.records)}
+        
+        method_plans = []
+        new_provenance = {}
+        for checker_cfg in config["checkers"]:
+            if "class_name" not in checker_cfg or "methods" not in checker_cfg:
                 continue
+             
+            if checker_cfg["class_name"]=="Filter" or checker_cfg["class_name"]=="LabelGenerator":
+                continue
+            
+            # 初始化评估器
+            checker_instance = initialize_checker(checker_cfg)
+            
+            for method_cfg in checker_cfg["methods"]:
+                if not method_cfg.get("enabled", True) or "method_name" not in method_cfg:
+                    continue
+                fingerprint = method_fingerprint(checker_cfg["class_name"], method_cfg)
+                columns = method_columns(checker_cfg["class_name"], method_cfg["method_name"])
+                reuse = is_reusable(old_provenance, columns, fingerprint)
+                if reuse:
+                    logger.info(f"Reusing columns {columns} of {checker_cfg['class_name']}.{method_cfg['method_name']}")
+                fields = [FIELDS_BY_COLUMN[col] for col in columns]
+                method_plans.append((checker_instance, method_cfg, fields, reuse))
+                new_provenance.update({col: fingerprint for col in columns})
+        
+        tmp_path = f"{intermediate_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        intermediate_columns = columns_for(fieldnames)
+        latencies = []
+        for index, (success, elapsed) in zip(range(len(cot_batch)), map_rows(
+                lambda index: timed(evaluate_example, index, cot_batch, method_plans, old_batch, old_index),
+                range(len(cot_batch)), row_workers)):
+            latencies.append(elapsed)
+            if success:
+                save_results(tmp_path, fieldnames, cot_batch.row(index, intermediate_columns))
+        log_latency("Checker evaluation", latencies)
+        
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, intermediate_path)
+            save_provenance(intermediate_path, new_provenance)
+        logger.info(f"Diagnostics summary: {DIAGNOSTICS.summary()}")
+        diagnostics_path = f"{intermediate_path}.diagnostics.jsonl"
+        logger.info(f"Saved {DIAGNOSTICS.save(diagnostics_path)} recent diagnostics to {diagnostics_path}")
+        if scheduler is not None:
+            logger.info(f"Scheduler ({scheduler.policy}) queue wait by length bucket: {scheduler.report()}")
         
         
         # 5. 过滤最优
+        filter_plan = None
         for filter_config in config["checkers"]:
             if filter_config["class_name"] =="Filter":
                 filter_instance = initialize_checker(filter_config)       
@@ -242,8 +414,27 @@ def main(config_path: str) -> None:
                             method_to_call = getattr(filter_instance, method_name)
                             params = method_cfg.get("params", {})
                             method_result = method_to_call(intermediate_example,**params)
+                            if method_name == "sweep":
+                                # 权重与阈值扫描结果单独保存，不覆盖best数据
+                                sweep_path = config.get("sweep_csv", os.path.join(os.path.dirname(output_path), "sweep_results.csv"))
+                                method_result.to_csv(sweep_path, index=False, encoding='utf-8-sig')
+                                logger.info(f"Saved {len(method_result)} sweep settings to {sweep_path}")
+                                continue
                             method_result.to_csv(output_path, index=False, encoding='utf-8-sig')
+                            if method_name == "filter":
+                                filter_plan = (params, method_result)
         
+        # 6. 抽样评估：估计全量数据上的评分、过滤通过率与best数据产出量
+        if sample is not None:
+            params, best = filter_plan if filter_plan else ({}, None)
+            report = quality_report(examples, sample, pd.read_csv(config["intermediate_path"]), best,
+                                    weights=params.get("weights"), thresholds=params.get("thresholds"),
+                                    confidence=sampling_cfg.get("confidence", 0.95))
+            report_path = os.path.join(os.path.dirname(config["cot_path"]), "quality_report.json")
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            logger.info(f"Estimated pass rate {report['pass_rate']}, yield {report['yield']}, "
+                        f"expected best rows {report['expected_best_rows']}; report saved to {report_path}")
         
         logger.info("Processing completed successfully")
 
@@ -258,6 +449,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", type=str, required=False, default='/lustre/project-A/sourcecode/hongji/Fin_Cot_Eval/testpipeline/config.json',
                        help="Path to configuration JSON")
+    parser.add_argument("--sample", type=int, default=None,
+                       help="Run on a stratified random sample of this many examples and report quality estimates")
     args = parser.parse_args()
     
-    main(args.config)
\ No newline at end of file
+    main(args.config, args.sample)
\ No newline at end of file
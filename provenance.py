@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import inspect
+import importlib
+from typing import Dict, List, Any, Optional
+
+# 每个 (检查器, 方法) 写入的输出列
+METHOD_COLUMNS = {
+    ("LabelGenerator", "LT_difficulty"): ['困难等级', 'COT答案', '正确性得分', '正确性过程', '采样次数'],
+    ("LabelGenerator", "LT_difficulty_logprob"): ['困难等级', 'COT答案', '正确性得分', '正确性过程', '采样次数'],
+    ("FormatChecker", "check_think"): ['思考格式得分'],
+    ("FormatChecker", "check_answer"): ['答案格式得分'],
+    ("LogicChecker", "check"): ['逻辑打分过程', '句间逻辑支持得分', '问答逻辑蕴含得分'],
+    ("ReflectionChecker", "check"): ['自我反思得分'],
+    ("CorrectnessChecker", "check"): ['答案一致得分'],
+    ("CorrectnessChecker", "compare_answers"): ['正确性复核得分'],
+}
+
+# 方法内部调用的其他方法（其中的prompt或逻辑变化同样会影响输出），不是检查器方法的名字在检查器所在模块中查找(如 RAGPruner)，
+# "模块.名字" 形式的在 checkers 包的对应模块中查找
+METHOD_DEPENDENCIES = {
+    ("LabelGenerator", "LT_difficulty"): ['lt_prompt', 'prune_passage', 'RAGPruner', 'should_stop', 'beta_cdf', 'is_correct',
+                                          'extract_result_content', 'compare_answers'],
+    ("LabelGenerator", "LT_difficulty_logprob"): ['logprob_samples', 'lt_prompt', 'prune_passage', 'RAGPruner', 'result_confidence',
+                                                  'is_correct', 'extract_result_content', 'compare_answers',
+                                                  'calibration.DifficultyCalibrator', 'calibration.IsotonicCalibrator'],
+    ("FormatChecker", "check_think"): ['is_mostly_chinese'],
+    ("FormatChecker", "check_answer"): ['check_answer_format'],
+    ("LogicChecker", "check"): ['parse_result'],
+    ("CorrectnessChecker", "check"): ['extract_result_content'],
+    ("CorrectnessChecker", "compare_answers"): ['extract_result_content'],
+}
+
+
+def provenance_path(data_path: str) -> str:
+    """数据文件对应的列溯源文件路径"""
+    return f"{data_path}.provenance.json"
+
+
+def method_columns(class_name: str, method_name: str) -> List[str]:
+    return METHOD_COLUMNS.get((class_name, method_name), [])
+
+
+def method_fingerprint(class_name: str, method_cfg: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> str:
+    """
+    计算产生某列的指纹: 检查器类名、方法名、参数、prompt模板版本(方法及其依赖的源码)以及可选的手动版本号,
+    extra 为影响该列的其他配置(如近重复聚类)
+    """
+    method_name = method_cfg["method_name"]
+    module = importlib.import_module(f"checkers.{class_name.lower()}")
+    CheckerClass = getattr(module, class_name)
+
+    sources = []
+    for name in [method_name] + METHOD_DEPENDENCIES.get((class_name, method_name), []):
+        try:
+            if "." in name:
+                module_name, attr = name.rsplit(".", 1)
+                target = getattr(importlib.import_module(f"checkers.{module_name}"), attr)
+            else:
+                target = getattr(CheckerClass, name) if hasattr(CheckerClass, name) else getattr(module, name)
+            sources.append(inspect.getsource(target))
+        except (AttributeError, OSError, TypeError):
+            sources.append(name)
+
+    payload = json.dumps({
+        "class_name": class_name,
+        "method_name": method_name,
+        "params": method_cfg.get("params", {}),
+        "version": method_cfg.get("version"),
+        "source": sources,
+        "extra": extra,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def load_provenance(data_path: str) -> Dict[str, str]:
+    """读取 列名 -> 指纹 映射, 文件不存在时返回空字典"""
+    path = provenance_path(data_path)
+    if not os.path.exists(data_path) or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_provenance(data_path: str, provenance: Dict[str, str]) -> None:
+    with open(provenance_path(data_path), "w", encoding="utf-8") as f:
+        json.dump(provenance, f, ensure_ascii=False, indent=2)
+
+
+def is_reusable(provenance: Dict[str, str], columns: List[str], fingerprint: str) -> bool:
+    """已有列全部存在且指纹一致时才可复用"""
+    return bool(columns) and all(provenance.get(col) == fingerprint for col in columns)
+
+
+def file_digest(path: str) -> Optional[str]:
+    """输入文件内容的哈希, 输入数据变化时生成列同样需要重新计算"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def row_key(question: Any, cot: Any) -> str:
+    """用问题与COT答案定位同一条数据"""
+    payload = f"{question}\x00{cot}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,148 @@
+import math
+from array import array
+from typing import Dict, List, Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+# 字段名 -> 输出列名，中文列名只在读写文件时使用
+COLUMN_NAMES = {
+    'question': 'question',
+    'rag': 'RAG',
+    'answer': 'answer',
+    'difficulty': '困难等级',
+    'cot': 'COT答案',
+    'correct': '正确性得分',
+    'process': '正确性过程',
+    'attempts': '采样次数',
+    'think_format': '思考格式得分',
+    'logic_process': '逻辑打分过程',
+    'logic_ent': '问答逻辑蕴含得分',
+    'logic_fav': '句间逻辑支持得分',
+    'reflection': '自我反思得分',
+    'answer_format': '答案格式得分',
+    'exact_match': '答案一致得分',
+    'correct_review': '正确性复核得分',
+    'diagnostics': '诊断代码',
+}
+FIELDS_BY_COLUMN = {column: field for field, column in COLUMN_NAMES.items()}
+
+TEXT_FIELDS = ('question', 'rag', 'answer', 'cot', 'process', 'logic_process', 'diagnostics')
+# 同一问题的多次尝试之间重复的文本
+SHARED_FIELDS = ('question', 'rag', 'answer')
+# 检查器按整数给分的字段, 输出时整数值写为整数; 其余评分(如困难等级)保持浮点格式
+INTEGER_FIELDS = ('correct', 'attempts', 'think_format', 'reflection', 'answer_format', 'exact_match', 'correct_review')
+SCORE_FIELDS = ('difficulty', 'correct', 'attempts', 'think_format', 'logic_ent', 'logic_fav', 'reflection', 'answer_format',
+                'exact_match', 'correct_review')
+
+
+def columns_for(fieldnames: List[str]) -> Dict[str, str]:
+    """由输出列名列表得到 字段名 -> 列名 的映射"""
+    return {FIELDS_BY_COLUMN[column]: column for column in fieldnames}
+
+
+class CotRecord:
+    """一条COT数据的文本字段"""
+    __slots__ = TEXT_FIELDS
+
+    def __init__(self, **fields):
+        for field in TEXT_FIELDS:
+            setattr(self, field, fields.get(field))
+
+
+class RecordBatch:
+    """
+    一批COT数据: 文本字段存放在 CotRecord 中, 同一问题的多次尝试共享同一份问题/RAG/参考答案字符串;
+    评分字段按列存放在 array('d') 中, 缺失值为NaN。
+    """
+    def __init__(self):
+        self.records = []
+        self.scores = {field: array('d') for field in SCORE_FIELDS}
+        self._pool = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def intern(self, value):
+        """相同的问题/RAG/参考答案文本只保留一份"""
+        if isinstance(value, str):
+            return self._pool.setdefault(value, value)
+        return value
+
+    def append(self, **fields) -> int:
+        record = CotRecord(**fields)
+        for field in SHARED_FIELDS:
+            setattr(record, field, self.intern(getattr(record, field)))
+        self.records.append(record)
+        for field in SCORE_FIELDS:
+            self.scores[field].append(self.to_float(fields.get(field)))
+        return len(self.records) - 1
+
+    def set(self, index: int, **fields) -> None:
+        record = self.records[index]
+        for field, value in fields.items():
+            if field in self.scores:
+                self.scores[field][index] = self.to_float(value)
+            else:
+                setattr(record, field, value)
+
+    def get(self, index: int, field: str):
+        if field in self.scores:
+            return self.scores[field][index]
+        return getattr(self.records[index], field)
+
+    def is_missing(self, index: int, field: str) -> bool:
+        value = self.get(index, field)
+        return value is None or (isinstance(value, float) and math.isnan(value))
+
+    @staticmethod
+    def to_float(value) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    @staticmethod
+    def format_score(value: float, field: str):
+        """输出时NaN写为空值, 整数评分字段写为整数"""
+        if math.isnan(value):
+            return None
+        return int(value) if field in INTEGER_FIELDS and value.is_integer() else value
+
+    def row(self, index: int, columns: Dict[str, str]) -> Dict[str, Any]:
+        """按 字段名 -> 列名 映射输出一行"""
+        row = {}
+        for field, column in columns.items():
+            if field in self.scores:
+                row[column] = self.format_score(self.scores[field][index], field)
+            else:
+                row[column] = getattr(self.records[index], field)
+        return row
+
+    def to_rows(self, columns: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self.records)):
+            yield self.row(index, columns)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, fields: Optional[List[str]] = None) -> "RecordBatch":
+        """从按中文列名读取的表格构建, 不在表格中的字段为空"""
+        batch = cls()
+        columns = {field: COLUMN_NAMES[field] for field in (fields or COLUMN_NAMES)}
+        batch.records = [CotRecord() for _ in range(len(df))]
+        for field in TEXT_FIELDS:
+            column = columns.get(field)
+            if column not in df:
+                continue
+            shared = field in SHARED_FIELDS
+            for record, value in zip(batch.records, df[column].tolist()):
+                if isinstance(value, float) and math.isnan(value):
+                    value = None
+                setattr(record, field, batch.intern(value) if shared else value)
+        for field in SCORE_FIELDS:
+            column = columns.get(field)
+            if column in df:
+                values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+            else:
+                values = np.full(len(df), np.nan)
+            batch.scores[field] = array('d', values.tobytes())
+        return batch
@@ -0,0 +1,230 @@
+"""
+抽样评估: 按分层随机抽样从数据集中抽取部分样本跑完整的生成与质检流程,
+再用分层估计给出各评分、过滤通过率与best数据产出量在全量数据上的估计值及置信区间。
+"""
+import os
+import math
+import heapq
+import logging
+from statistics import NormalDist
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from checkers.filter import Filter
+
+logger = logging.getLogger(__name__)
+
+# 报告中估计均值与分布的评分列
+SCORE_COLUMNS = ['困难等级'] + list(Filter.max_scores.keys())
+# 抽样评估时改写到单独目录的输出路径
+OUTPUT_KEYS = ("cot_path", "intermediate_path", "output_csv", "sweep_csv")
+
+
+class StratifiedSample:
+    """抽中的样本下标、各样本所在层以及各层的总体大小"""
+    def __init__(self, indices, strata, population):
+        self.indices = indices
+        self.strata = strata
+        self.population = population
+
+    def weights(self):
+        """每个抽中样本代表的总体样本数 N_h / n_h"""
+        sampled = pd.Series(self.strata).value_counts()
+        return np.array([self.population[s] / sampled[s] for s in self.strata], dtype=np.float64)
+
+
+def sample_config(config: Dict[str, Any], output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """输出路径改到 output_dir(默认为 cot_path 所在目录下的 sample 目录), 不覆盖全量运行的结果"""
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(config["cot_path"]), "sample")
+    os.makedirs(output_dir, exist_ok=True)
+    config = dict(config)
+    for key in OUTPUT_KEYS:
+        if key in config:
+            config[key] = os.path.join(output_dir, os.path.basename(config[key]))
+    return config
+
+
+def stratum_labels(examples: List[Dict[str, Any]], key: Optional[str] = None, n_buckets: int = 4) -> List[str]:
+    """按 key 列的取值分层; 未指定 key 时按问题长度的分位数分为 n_buckets 层"""
+    if key:
+        return [str(example.get(key)) for example in examples]
+    lengths = np.array([len(str(example.get("question", ""))) for example in examples])
+    edges = np.unique(np.quantile(lengths, np.linspace(0, 1, n_buckets + 1)[1:-1])) if len(lengths) else []
+    buckets = np.searchsorted(edges, lengths, side="right")
+    bounds = [0] + [int(e) for e in edges] + [None]
+    return [f"len {bounds[b]}-{bounds[b + 1] if bounds[b + 1] is not None else ''}" for b in buckets]
+
+
+def merge_small_strata(groups: Dict[str, List[int]], size: int, min_per_stratum: int) -> Dict[str, List[int]]:
+    """层数 * min_per_stratum 超过抽样数时, 依次将最小的两层合并, 使每层的最少抽样数之和不超过 size"""
+    groups = dict(groups)
+    merged = 0
+    while len(groups) > 1 and len(groups) * min_per_stratum > size:
+        first, second = sorted(groups, key=lambda label: (len(groups[label]), label))[:2]
+        members = groups.pop(first) + groups.pop(second)
+        label = first if first.startswith("merged(") else f"merged({first})"
+        groups[label] = sorted(members)
+        merged += 1
+    if merged:
+        logger.warning(f"Merged {merged} small strata so that {len(groups)} strata x {min_per_stratum} fit in a sample of {size}")
+    return groups
+
+
+def allocate(population: Dict[str, int], size: int, min_per_stratum: int) -> Dict[str, int]:
+    """
+    每层先分配 min(min_per_stratum, N_h) 个, 其余名额逐个分给 N_h / (n_h + 1) 最大的层(按层大小成比例分配),
+    总数恰为 min(size, N)
+    """
+    allocation = {label: min(min_per_stratum, n) for label, n in population.items()}
+    remaining = min(size, sum(population.values())) - sum(allocation.values())
+    heap = [(-n / (allocation[label] + 1), label) for label, n in population.items() if allocation[label] < n]
+    heapq.heapify(heap)
+    while remaining > 0 and heap:
+        _, label = heapq.heappop(heap)
+        allocation[label] += 1
+        remaining -= 1
+        if allocation[label] < population[label]:
+            heapq.heappush(heap, (-population[label] / (allocation[label] + 1), label))
+    return allocation
+
+
+def stratified_sample(examples: List[Dict[str, Any]], size: int, key: Optional[str] = None, n_buckets: int = 4,
+                      min_per_stratum: int = 2, seed: int = 0) -> StratifiedSample:
+    """
+    按层大小比例分配抽样数(每层至少 min_per_stratum 条, 以便估计层内方差), 层内不放回随机抽样;
+    抽样总数不超过 size, 层数过多时先合并最小的层
+    """
+    labels = stratum_labels(examples, key, n_buckets)
+    groups = {}
+    for index, label in enumerate(labels):
+        groups.setdefault(label, []).append(index)
+    groups = merge_small_strata(groups, size, min_per_stratum)
+    allocation = allocate({label: len(members) for label, members in groups.items()}, size, min_per_stratum)
+    rng = np.random.default_rng(seed)
+
+    stratum_of = {}
+    for label in sorted(groups):
+        for i in rng.choice(groups[label], allocation[label], replace=False):
+            stratum_of[int(i)] = label
+    indices = sorted(stratum_of)
+    return StratifiedSample(indices, [stratum_of[i] for i in indices], {label: len(m) for label, m in groups.items()})
+
+
+def wilson_interval(p: float, n: float, z: float):
+    """比例的Wilson置信区间, n 为(有效)样本数"""
+    if n <= 0:
+        return 0.0, 1.0
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return float(max(0.0, center - half)), float(min(1.0, center + half))
+
+
+def stratified_estimate(values, sample: StratifiedSample, confidence: float = 0.95, proportion: bool = False) -> Dict[str, Any]:
+    """
+    总体均值的分层估计: sum_h W_h * mean_h, 方差 sum_h W_h^2 * (1 - n_h/N_h) * s_h^2 / n_h,
+    values 中的NaN(该样本没有结果)不参与对应层的估计, 全部缺失的层按剩余层的权重重新归一化。
+    proportion 为True时(取值在0-1之间的比例, 如通过率)使用Wilson区间, 有效样本数按 p(1-p)/方差 折算,
+    方差为0时取实际样本数; 否则使用正态区间。层内样本取值全部相同(方差为0)的层列在 zero_variance_strata 中
+    """
+    frame = pd.DataFrame({"value": np.asarray(values, dtype=np.float64), "stratum": sample.strata}).dropna()
+    if frame.empty:
+        return {"mean": None, "ci_low": None, "ci_high": None, "n": 0}
+    total = sum(sample.population[s] for s in frame["stratum"].unique())
+    mean = 0.0
+    variance = 0.0
+    zero_variance = []
+    for stratum, group in frame.groupby("stratum"):
+        weight = sample.population[stratum] / total
+        n = len(group)
+        mean += weight * group["value"].mean()
+        if n > 1 and group["value"].var(ddof=1) > 0:
+            fpc = max(0.0, 1 - n / sample.population[stratum])
+            variance += weight ** 2 * fpc * group["value"].var(ddof=1) / n
+        else:
+            zero_variance.append(stratum)
+    mean = float(mean)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    if proportion:
+        p = min(max(mean, 0.0), 1.0)
+        n_eff = p * (1 - p) / variance if variance > 0 and 0 < p < 1 else len(frame)
+        low, high = wilson_interval(p, n_eff, z)
+    else:
+        half = z * math.sqrt(variance)
+        low, high = mean - half, mean + half
+    estimate = {"mean": round(mean, 4), "ci_low": round(low, 4), "ci_high": round(high, 4), "n": len(frame)}
+    if zero_variance:
+        estimate["zero_variance_strata"] = sorted(zero_variance)
+    return estimate
+
+
+def weighted_quantiles(values, weights, quantiles=(0.1, 0.5, 0.9)) -> Dict[str, float]:
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    keep = ~np.isnan(values)
+    if not keep.any():
+        return {}
+    order = np.argsort(values[keep], kind="mergesort")
+    values, weights = values[keep][order], weights[keep][order]
+    cumulative = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return {f"p{int(q * 100)}": round(float(np.interp(q, cumulative, values)), 4) for q in quantiles}
+
+
+def quality_report(examples: List[Dict[str, Any]], sample: StratifiedSample, scored: pd.DataFrame,
+                   best: Optional[pd.DataFrame], weights=None, thresholds=None, confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    examples 为抽中的样本(与 sample.indices 一一对应), scored 为这些样本的质检结果, best 为过滤结果。
+    以样本为单位估计: 各评分的均值、COT通过过滤阈值的比例(pass_rate)、样本产出best数据的比例(yield),
+    以及全量数据预计的best行数; 评分分布为按抽样权重加权的COT级分位数
+    """
+    filter_instance = Filter()
+    if weights is None:
+        weights = filter_instance.default_weights
+    scored = scored.copy()
+    if len(scored):
+        composite = filter_instance.calculate_composite_score(filter_instance.normalize_by_max(scored), weights)
+        scored['通过过滤'] = composite.index.isin(filter_instance.filter_data(composite, thresholds).index).astype(float)
+    else:
+        scored['通过过滤'] = pd.Series(dtype=float)
+    by_question = scored.groupby('question')
+    best_questions = set(best['question']) if best is not None and len(best) else set()
+
+    questions = [example["question"] for example in examples]
+    per_example = {column: [] for column in SCORE_COLUMNS + ['通过过滤']}
+    for question in questions:
+        rows = by_question.get_group(question) if question in by_question.groups else None
+        for column in per_example:
+            if rows is None or column not in rows:
+                # 没有生成结果的样本不计入评分均值, 但计为未通过过滤
+                per_example[column].append(0.0 if column == '通过过滤' else math.nan)
+            else:
+                per_example[column].append(pd.to_numeric(rows[column], errors='coerce').mean())
+    produced = [1.0 if question in best_questions else 0.0 for question in questions]
+
+    # COT级分位数的权重: 样本的抽样权重平均分给该样本的各条COT
+    example_weight = dict(zip(questions, sample.weights()))
+    row_counts = scored['question'].map(scored['question'].value_counts())
+    row_weights = scored['question'].map(example_weight).fillna(0) / row_counts
+
+    population = sum(sample.population.values())
+    yield_estimate = stratified_estimate(produced, sample, confidence, proportion=True)
+    report = {
+        "population": population,
+        "sample_size": len(examples),
+        "strata": {s: {"population": n, "sampled": sample.strata.count(s)} for s, n in sorted(sample.population.items())},
+        "scores": {},
+        "pass_rate": stratified_estimate(per_example['通过过滤'], sample, confidence, proportion=True),
+        "yield": yield_estimate,
+        "expected_best_rows": {k: round(yield_estimate[k] * population, 1) if yield_estimate[k] is not None else None
+                               for k in ("mean", "ci_low", "ci_high")},
+        "confidence": confidence,
+    }
+    for column in SCORE_COLUMNS:
+        estimate = stratified_estimate(per_example[column], sample, confidence)
+        if column in scored:
+            estimate.update(weighted_quantiles(pd.to_numeric(scored[column], errors='coerce'), row_weights))
+        report["scores"][column] = estimate
+    return report